@@ -1,20 +1,37 @@
+import hashlib
+import io
+import json
+import os
 import re
 import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
 from pathlib import Path
 import pandas as pd
-import matplotlib.pyplot as plt
+import matplotlib
+matplotlib.use("Agg")
+from matplotlib.figure import Figure
 
 
 # CONFIG
 # =======================
 INPUT_CSV = "/app/data/Zelfscan_final.csv"
+INPUT_PARQUET = "/app/data/Zelfscan_final.parquet"
 SEP = ";"
 
 GROUP_BY_QID = "Q19"
 ANALYZE_QIDS = ["Q24", "Q54"]
 
 OUT_DIR = "/app/data/charts"
-TYPST_EXE = "typst"
+# Content-hash per groep; groepen met ongewijzigde counts worden niet opnieuw gerenderd
+MANIFEST_PATH = "/app/data/charts_manifest.json"
+TYPST_EXE = "typst"  # >= 0.13: image() met bytes, bron via stdin
+CHART_FORMAT = "svg"  # "svg" (vector) of "png"; charts blijven in geheugen
+
+# Aantal worker-processen voor het renderen per groep (1 = serieel)
+RENDER_WORKERS = int(os.getenv("VISUALS_WORKERS", str(min(4, os.cpu_count() or 1))))
 # =======================
 
 
@@ -24,11 +41,37 @@ def safe_filename(s: str) -> str:
     return s[:120] if len(s) > 120 else s
 
 
+def resolve_input() -> str:
+    # Parquet (getypeerd, geen re-parse) heeft voorrang op de CSV
+    return INPUT_PARQUET if Path(INPUT_PARQUET).exists() else INPUT_CSV
+
+
 def load_long(path: str) -> pd.DataFrame:
-    df = pd.read_csv(path, sep=SEP, dtype="string")
-    df["ResponsID"] = df["ResponsID"].astype("string").str.strip()
-    df["QuestionID"] = df["QuestionID"].astype("string").str.strip()
-    df["Answer"] = df["Answer"].astype("string").str.strip()
+    if path.endswith(".parquet"):
+        df = pd.read_parquet(path)
+    elif path.endswith(".feather"):
+        df = pd.read_feather(path)
+    else:
+        df = pd.read_csv(path, sep=SEP, dtype="category")
+    return prepare_long(df)
+
+
+def _compact_strip(s: pd.Series) -> pd.Series:
+    # Strippen op de categorieën i.p.v. op elke rij
+    s = s.astype("category")
+    stripped = s.cat.categories.astype(str).str.strip()
+    if stripped.is_unique:
+        return s.cat.rename_categories(stripped)
+    return s.astype("string").str.strip().astype("category")
+
+
+def prepare_long(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Normaliseert de long-tabel naar compacte categoricals (ResponsID, QuestionID, Answer).
+    """
+    df = df[["ResponsID", "QuestionID", "Answer"]].copy()
+    for col in ["ResponsID", "QuestionID", "Answer"]:
+        df[col] = _compact_strip(df[col])
     df = df.dropna(subset=["ResponsID", "QuestionID"])
     return df
 
@@ -42,27 +85,50 @@ def build_group_map(df: pd.DataFrame, group_qid: str) -> pd.DataFrame:
     return g
 
 
-def counts_for_group_and_qid(df: pd.DataFrame, group_map: pd.DataFrame, group_value: str, qid: str) -> pd.DataFrame:
-    base = df[df["QuestionID"] == qid][["ResponsID", "Answer"]].copy()
-    base = base.dropna(subset=["Answer"])
+def build_count_cube(df: pd.DataFrame, group_map: pd.DataFrame, qids: list[str] | None = None) -> pd.Series:
+    """
+    Telt in één groupby-pass alle antwoorden per (GroupValue, QuestionID, Answer).
+    Met qids worden alleen die vragen meegenomen; None = alle vragen.
+    """
+    base = df if qids is None else df[df["QuestionID"].isin(qids)]
+    base = base[["ResponsID", "QuestionID", "Answer"]].dropna(subset=["Answer"])
     base = base[base["Answer"] != ""]
 
     joined = base.merge(group_map, on="ResponsID", how="inner")
-    joined = joined[joined["GroupValue"] == group_value]
-
-    if joined.empty:
-        return joined
-
-    counts = (
-        joined.groupby("Answer", dropna=False)
+    return (
+        joined.groupby(["GroupValue", "QuestionID", "Answer"], observed=True)
         .size()
-        .reset_index(name="Count")
-        .sort_values("Count", ascending=False)
+        .rename("Count")
+        .sort_index()
     )
-    return counts
 
 
-def make_pie_temp_png(counts: pd.DataFrame, group_value: str, qid: str, tmp_dir: Path) -> str | None:
+def cube_from_rows(rows: list[tuple[str, str, str, int]]) -> pd.Series:
+    """
+    Bouwt de count-cube uit (GroupValue, QuestionID, Answer, Count) rijen,
+    bv. het resultaat van Database.answer_counts.
+    """
+    df = pd.DataFrame(rows, columns=["GroupValue", "QuestionID", "Answer", "Count"])
+    return df.set_index(["GroupValue", "QuestionID", "Answer"])["Count"].sort_index()
+
+
+def counts_from_cube(cube: pd.Series, group_value: str, qid: str) -> pd.DataFrame:
+    try:
+        sub = cube.loc[(group_value, qid)]
+    except KeyError:
+        return pd.DataFrame(columns=["Answer", "Count"])
+
+    return sub.reset_index(name="Count").sort_values("Count", ascending=False)
+
+
+def counts_for_group_and_qid(df: pd.DataFrame, group_map: pd.DataFrame, group_value: str, qid: str) -> pd.DataFrame:
+    return counts_from_cube(build_count_cube(df, group_map, [qid]), group_value, qid)
+
+
+def make_pie_image(counts: pd.DataFrame, group_value: str, qid: str, fmt: str = CHART_FORMAT) -> bytes | None:
+    """
+    Rendert een taartdiagram naar een buffer in het geheugen (svg of png).
+    """
     if counts is None or counts.empty:
         return None
     total = int(counts["Count"].sum())
@@ -72,10 +138,6 @@ def make_pie_temp_png(counts: pd.DataFrame, group_value: str, qid: str, tmp_dir:
     labels = counts["Answer"].astype(str).tolist()
     values = counts["Count"].tolist()
 
-    tmp_dir.mkdir(parents=True, exist_ok=True)
-    safe_group = safe_filename(group_value)
-    out_path = tmp_dir / f"pie_{safe_group}_{qid}.png"
-
     # Bepaal index van grootste groep
     max_idx = int(counts["Count"].astype(int).values.argmax())
 
@@ -83,44 +145,45 @@ def make_pie_temp_png(counts: pd.DataFrame, group_value: str, qid: str, tmp_dir:
     explode = [0.0] * len(values)
     explode[max_idx] = 0.08  # pas aan naar smaak (bv. 0.05–0.15)
 
-    plt.figure()
-    plt.pie(
+    # OO-API zonder pyplot: geen globale state, dus veilig in parallelle workers
+    fig = Figure()
+    ax = fig.subplots()
+    ax.pie(
         values,
         labels=labels,
         autopct="%1.1f%%",
         explode=explode,
         startangle=90,  # optioneel: iets rustiger layout
     )
-    plt.gca().set_aspect("equal")
-    plt.title(f"{qid} – {group_value}")
-    plt.savefig(out_path, dpi=150, bbox_inches="tight")
-    plt.close()
+    ax.set_aspect("equal")
+    ax.set_title(f"{qid} – {group_value}")
 
+    buf = io.BytesIO()
+    fig.savefig(buf, format=fmt, dpi=150, bbox_inches="tight")
+    data = buf.getvalue()
+    return data or None
 
-    if out_path.stat().st_size == 0:
-        try:
-            out_path.unlink()
-        except OSError:
-            pass
-        return None
 
-    return str(out_path)
+def typst_image(data: bytes, fmt: str) -> str:
+    """
+    Typst-expressie die een image direct uit de bron laadt (geen bestand nodig).
+    SVG gaat als string mee, PNG als byte-array.
+    """
+    if fmt == "svg":
+        text = data.decode("utf-8")
+        text = text.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n").replace("\r", "")
+        return f'image(bytes("{text}"), format: "svg", width: 100%)'
+    return f'image(bytes(({",".join(map(str, data))},)), format: "{fmt}", width: 100%)'
 
 
-def write_typst_and_compile_pdf(group_value: str, image_paths: list[str], out_dir: Path) -> Path:
+def write_typst_and_compile_pdf(group_value: str, images: list[bytes], out_dir: Path, fmt: str = CHART_FORMAT) -> Path:
     out_dir.mkdir(parents=True, exist_ok=True)
 
     safe_group = safe_filename(group_value)
-    typ_path = out_dir / f"group_{safe_group}.typ"
     pdf_path = out_dir / f"group_{safe_group}.pdf"
 
-    images_block = "\n".join(
-    [
-        f'#image("{Path(p).resolve().relative_to(out_dir.resolve()).as_posix()}", width: 100%)\n#v(14pt)'
-        for p in image_paths
-    ]
-)
-    
+    images_block = "\n".join(f"#{typst_image(data, fmt)}\n#v(14pt)" for data in images)
+
     typ_content = f"""\
 #set page(margin: 18mm)
 #set text(size: 11pt)
@@ -130,76 +193,189 @@ def write_typst_and_compile_pdf(group_value: str, image_paths: list[str], out_di
 {images_block}
 """
 
-    typ_path.write_text(typ_content, encoding="utf-8")
-
-    # Compile met typst
+    # Compile met typst; bron via stdin, dus geen .typ of images op schijf
     result = subprocess.run(
-        [TYPST_EXE, "compile", str(typ_path), str(pdf_path)],
+        [TYPST_EXE, "compile", "-", str(pdf_path)],
+        input=typ_content.encode("utf-8"),
         capture_output=True,
-        text=True,
     )
 
     if result.returncode != 0:
-        print("Typst compile error:")
-        print(result.stderr)
-        raise RuntimeError("Typst compile failed")
+        raise RuntimeError(f"Typst compile failed: {result.stderr.decode('utf-8', 'replace').strip()}")
 
     return pdf_path
 
 
-def main():
-    df = load_long(INPUT_CSV)
-    group_map = build_group_map(df, GROUP_BY_QID)
-
-    if group_map.empty:
+@dataclass
+class GroupResult:
+    group_value: str
+    pdf_path: str | None = None
+    skipped: bool = False
+    error: str | None = None
+    unchanged: bool = False
+
+
+def group_hash(group_value: str, counts_by_qid: dict[str, pd.DataFrame]) -> str:
+    h = hashlib.sha256()
+    h.update(json.dumps([group_value, ANALYZE_QIDS, CHART_FORMAT]).encode("utf-8"))
+    for qid in sorted(counts_by_qid):
+        counts = counts_by_qid[qid]
+        rows = sorted(zip(counts["Answer"].astype(str), counts["Count"].astype(int).tolist()))
+        h.update(json.dumps([qid, rows]).encode("utf-8"))
+    return h.hexdigest()
+
+
+def load_manifest(path: str) -> dict[str, str]:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(path: str, manifest: dict[str, str]) -> None:
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def render_group(group_value: str, counts_by_qid: dict[str, pd.DataFrame], out_dir: Path) -> GroupResult:
+    """
+    Rendert de charts en de PDF van één groep. Fouten worden in het resultaat
+    teruggegeven zodat één falende groep de andere niet stopt.
+    """
+    try:
+        images: list[bytes] = []
+
+        for qid, counts in counts_by_qid.items():
+            data = make_pie_image(counts, group_value, qid)
+
+            if data:
+                images.append(data)
+
+        if not images:
+            return GroupResult(group_value, skipped=True)
+
+        pdf_path = write_typst_and_compile_pdf(group_value, images, out_dir)
+        return GroupResult(group_value, pdf_path=str(pdf_path))
+
+    except Exception as e:
+        return GroupResult(group_value, error=f"{type(e).__name__}: {e}")
+
+
+_pool: ProcessPoolExecutor | None = None
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    # Pool blijft bestaan tussen aanroepen; "spawn" omdat de aanroeper threads kan hebben
+    global _pool
+    if _pool is None or _pool._max_workers != workers:
+        if _pool is not None:
+            _pool.shutdown()
+        _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def _reset_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+    _pool = None
+
+
+def main(
+    long_df: pd.DataFrame | None = None,
+    workers: int | None = None,
+    force: bool = False,
+    cube: pd.Series | None = None,
+    out_dir: str | None = None,
+    manifest_path: str | None = None,
+) -> list[GroupResult]:
+    """
+    Maakt per groep een PDF. Een long-tabel uit de Zelfscan-pipeline of een kant-en-klare
+    count-cube (bv. uit de database) kan direct worden meegegeven; anders wordt de
+    long-tabel ingelezen van schijf. Met workers > 1 worden groepen parallel gerenderd
+    in een process pool. Groepen waarvan de counts niet veranderd zijn sinds de vorige
+    run worden overgeslagen (tenzij force). out_dir/manifest_path scheiden de output
+    per survey (standaard OUT_DIR en MANIFEST_PATH).
+    """
+    manifest_path = manifest_path or MANIFEST_PATH
+    if cube is None:
+        df = prepare_long(long_df) if long_df is not None else load_long(resolve_input())
+        group_map = build_group_map(df, GROUP_BY_QID)
+        cube = build_count_cube(df, group_map, ANALYZE_QIDS)
+        groups = group_map["GroupValue"].astype(str).unique()
+    else:
+        groups = cube.index.get_level_values("GroupValue").astype(str).unique()
+
+    if len(groups) == 0:
+        # Lege manifest wegschrijven: de run is wel gedaan, er is alleen (nog) niets te renderen
+        os.makedirs(os.path.dirname(manifest_path) or ".", exist_ok=True)
+        save_manifest(manifest_path, {})
         print("Geen groepen gevonden. Stop.")
-        return
+        return []
 
-    out_dir = Path(OUT_DIR)
+    out_dir = Path(out_dir or OUT_DIR)
     out_dir.mkdir(parents=True, exist_ok=True)
 
-    # Root voor tijdelijke images
-    tmp_root = out_dir / "_tmp"
-    tmp_root.mkdir(parents=True, exist_ok=True)
-
     # === PER GROEP ===
-    for group_value in sorted(group_map["GroupValue"].astype(str).unique()):
-        safe_group = safe_filename(group_value)
-
-        tmp_dir = tmp_root / safe_group
-        tmp_dir.mkdir(parents=True, exist_ok=True)
-
-        temp_images: list[str] = []
-
-        for qid in ANALYZE_QIDS:
-            counts = counts_for_group_and_qid(df, group_map, group_value, qid)
-            img_path = make_pie_temp_png(counts, group_value, qid, tmp_dir)
-
-            if img_path:
-                temp_images.append(img_path)
-
-        if not temp_images:
-            print(f"Groep '{group_value}': geen data; PDF overgeslagen.")
+    tasks = {
+        group_value: {qid: counts_from_cube(cube, group_value, qid) for qid in ANALYZE_QIDS}
+        for group_value in sorted(groups)
+    }
+
+    # Alleen groepen met gewijzigde counts (of ontbrekende PDF) renderen
+    old_manifest = {} if force else load_manifest(manifest_path)
+    hashes = {g: group_hash(g, counts) for g, counts in tasks.items()}
+    results = []
+    for g in list(tasks):
+        pdf_path = out_dir / f"group_{safe_filename(g)}.pdf"
+        if old_manifest.get(g) == hashes[g] and pdf_path.exists():
+            results.append(GroupResult(g, pdf_path=str(pdf_path), unchanged=True))
+            del tasks[g]
+
+    if workers is None:
+        workers = RENDER_WORKERS
+
+    if workers > 1 and len(tasks) > 1:
+        pool = _get_pool(workers)
+        futures = {g: pool.submit(render_group, g, counts, out_dir) for g, counts in tasks.items()}
+        for g, future in futures.items():
+            try:
+                results.append(future.result())
+            except Exception as e:
+                # Bv. een gecrashte worker; een kapotte pool wordt de volgende keer vervangen
+                if isinstance(e, BrokenProcessPool):
+                    _reset_pool()
+                results.append(GroupResult(g, error=f"{type(e).__name__}: {e}"))
+    else:
+        results += [render_group(g, counts, out_dir) for g, counts in tasks.items()]
+
+    results.sort(key=lambda r: r.group_value)
+
+    # Gefaalde groepen niet in de manifest, zodat ze de volgende keer opnieuw worden geprobeerd
+    save_manifest(manifest_path, {r.group_value: hashes[r.group_value] for r in results if not r.error})
+
+    n_unchanged = sum(r.unchanged for r in results)
+    if n_unchanged:
+        print(f"{n_unchanged} groep(en) ongewijzigd; niet opnieuw gerenderd.")
+
+    for r in results:
+        if r.unchanged:
             continue
+        if r.error:
+            print(f"Groep '{r.group_value}': FOUT - {r.error}")
+        elif r.skipped:
+            print(f"Groep '{r.group_value}': geen data; PDF overgeslagen.")
+        else:
+            print(f"PDF gemaakt: {r.pdf_path}")
 
-        try:
-            pdf_path = write_typst_and_compile_pdf(group_value, temp_images, out_dir)
-            print(f"PDF gemaakt: {pdf_path}")
-        finally:
-            # Opruimen tijdelijke PNG's
-            for p in temp_images:
-                try:
-                    Path(p).unlink()
-                except OSError:
-                    pass
-
-            # Opruimen lege tmp map
-            try:
-                tmp_dir.rmdir()
-            except OSError:
-                pass
+    return results
 
 
 if __name__ == "__main__":
-    main()
+    results = main()
+    if any(r.error for r in results):
+        raise SystemExit(1)
 
@@ -1,164 +1,259 @@
-import re
-import pandas as pd
-
-# ====== CONFIG ======
-RAW_CSV = "Zelfscan DUMMY.csv"
-CLEAN_CSV = "Zelfscan_clean.csv"
-AVG_CSV = "Zelfscan_avg.csv"
-FINAL_CSV = "Zelfscan_final.csv"
-SEP = ";"
-# ====================
-
-# Ruwe data inladen uit CSV bestand 
-def data_extract(raw_path: str) -> pd.DataFrame:
-    print("CSV inladen...")
-    raw = pd.read_csv(raw_path, sep=SEP, engine="python", header=None)
-    print(f"- Ruwe data geladen: {raw.shape[0]} rijen x {raw.shape[1]} kolommen\n")
-    return raw
-
-#
-def data_cleanup(raw: pd.DataFrame) -> pd.DataFrame:
-    print("Cleanup Qualtrics data...")
-
-    # Header instellen
-    header_row = raw.iloc[0].astype(str).tolist()
-    data = raw.iloc[1:].copy()
-    data.columns = header_row
-
-    # Verwijder alle "label/vraagtekst"-rijen boven de eerste echte response rij
-    resp_candidates = ["ResponseId", "ResponseID", "responseid"]
-    resp_col = next((c for c in resp_candidates if c in data.columns), None)
-
-    # Regex voor ResponseId
-    resp_re = re.compile(r"^R_[A-Za-z0-9]+$")
-
-    resp_series = data[resp_col].fillna("").astype(str).str.strip()
-    data_row_mask = resp_series.str.match(resp_re)
-
-    first_data_pos = data_row_mask.idxmax()
-    clean_data = data.loc[first_data_pos:].copy()
-    clean_data = clean_data.dropna(how="all")
-
-    n_dropped = (data.index.get_loc(first_data_pos))  # aantal rijen erboven
-    print(f"- Label/vraagtekst-rijen verwijderd boven eerste response: {n_dropped}")
-
-    print(f"- Overgebleven rijen: {len(clean_data)}")
-    print(f"- Kolommen: {len(clean_data.columns)}\n")
-
-    clean_data.to_csv(CLEAN_CSV, sep=SEP, index=False)
-    print(f"- Clean data geschreven naar: {CLEAN_CSV}\n")
-
-    return clean_data
-
-def data_avg_proof(df: pd.DataFrame) -> pd.DataFrame:
-    print("AVG-proof...")
-
-    # PII-kolommen verwijderen
-    col_to_delete = [
-        "IPAddress",
-        "RecipientLastName",
-        "RecipientFirstName",
-        "RecipientEmail",
-        "Q2 ",
-        "Q3",
-        "Q4",
-        "Q5",  
-        "Q5_1",
-        "Q9",
-    ]
-
-    present = [c for c in col_to_delete if c in df.columns]
-    print("\n- Kolommen die als PII worden verwijderd:")
-    if present:
-        for c in present:
-            print(f"  • {c}")
-        df = df.drop(columns=present)
-    else:
-        print("  • (Geen van de geconfigureerde PII-kolommen gevonden)")
-
-    print(f"\n- Na kolommen verwijderen: {df.shape[0]} rijen x {df.shape[1]} kolommen")
-
-    # Regex checks
-    email_re = re.compile(r"[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}")
-    ip_re = re.compile(
-        r"\b(?:(?:25[0-5]|2[0-4]\d|[01]?\d\d?)\.){3}(?:25[0-5]|2[0-4]\d|[01]?\d\d?)\b"
-    )
-
-    as_str = df.fillna("").astype(str)
-
-    def count_matches(regex: re.Pattern) -> int:
-        return int(as_str.apply(lambda col: col.str.contains(regex, na=False)).sum().sum())
-
-    email_hits_before = count_matches(email_re)
-    ip_hits_before = count_matches(ip_re)
-
-    print("\n- PII-controles in overgebleven kolommen (voor):")
-    print(f"  • Cellen die op e-mailadres lijken : {email_hits_before}")
-    print(f"  • Cellen die op IP-adres lijken    : {ip_hits_before}")
-
-    # PII waardes verwijderen in alle overgebleven kolommen
-    def redact_pii_cellwise(series: pd.Series) -> pd.Series:
-        s = series.fillna("").astype(str)
-        # Als de cel een email of ip bevat
-        mask = s.str.contains(email_re, na=False) | s.str.contains(ip_re, na=False)
-        if mask.any():
-            s.loc[mask] = ""
-        return s
-
-    # Pas toe
-    df = df.apply(redact_pii_cellwise, axis=0)
-
-    print(f"\n- Na AVG-proof: {df.shape[0]} rijen x {df.shape[1]} kolommen")
-
-    # Wegschrijven
-    df.to_csv(AVG_CSV, sep=SEP, index=False)
-    print(f"- AVG-proof bestand geschreven naar: {AVG_CSV}\n")
-
-    return df
-
-def data_unpivot(df: pd.DataFrame) -> pd.DataFrame:
-    print("Data unpivot...")
-
-    # Zoek ResponseId-kolom
-    resp_candidates = ["ResponseId", "ResponseID", "responseid", "Response ID"]
-    resp_col = next((c for c in resp_candidates if c in df.columns), None)
-
-    # Waardes naar String
-    resp_series = (
-        df[resp_col]
-        .astype("string")
-        .str.strip()
-    )
-
-    # Filter: alleen niet-leeg en niet-NA
-    valid_mask = resp_series.notna() & (resp_series != "")
-
-    # Alleen rijen met ResponseId
-    work = df[valid_mask].copy()
-    question_cols = [c for c in work.columns if c != resp_col]
-
-    # Unpivot
-    final_df = work.melt(
-        id_vars=[resp_col],
-        value_vars=question_cols,
-        var_name="QuestionID",
-        value_name="Answer"
-    )
-
-    final_df = final_df.rename(columns={resp_col: "ResponsID"})
-    final_df = final_df[["ResponsID", "QuestionID", "Answer"]]
-
-    # Wegschrijven
-    final_df.to_csv(FINAL_CSV, sep=SEP, index=False)
-
-    return final_df
-
-def main():
-    raw = data_extract(RAW_CSV)
-    clean = data_cleanup(raw)
-    avg = data_avg_proof(clean)
-    _ = data_unpivot(avg)
-
-
-if __name__ == "__main__":
+import os
+import re
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_datetime64_any_dtype, is_numeric_dtype, is_timedelta64_dtype
+
+from config import PII_COLUMNS
+
+# ====== CONFIG ======
+RAW_CSV = "Zelfscan DUMMY.csv"
+CLEAN_CSV = "Zelfscan_clean.csv"
+AVG_CSV = "Zelfscan_avg.csv"
+FINAL_CSV = "Zelfscan_final.csv"
+FINAL_PARQUET = "Zelfscan_final.parquet"
+SEP = ";"
+
+# Alleen deze vragen in de long-tabel houden (None = alle vragen)
+KEEP_QIDS = None
+
+# Tussenresultaten (clean/avg/final CSV) alleen wegschrijven als debug-output
+WRITE_DEBUG_CSV = os.getenv("ZELFSCAN_DEBUG_CSV", "0") == "1"
+
+# PII-patronen die in alle overgebleven kolommen worden weggelakt.
+# Nieuwe regels hier toevoegen; ze worden samengevoegd tot één regex.
+PII_PATTERNS = {
+    "email": r"[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}",
+    "ip": r"\b(?:(?:25[0-5]|2[0-4]\d|[01]?\d\d?)\.){3}(?:25[0-5]|2[0-4]\d|[01]?\d\d?)\b",
+}
+# ====================
+
+try:
+    import pyarrow  # noqa: F401
+    HAVE_PYARROW = True
+except ImportError:
+    HAVE_PYARROW = False
+
+# Ruwe data inladen uit CSV bestand 
+def data_extract(raw_path: str) -> pd.DataFrame:
+    print("CSV inladen...")
+    # Alles als tekst: de eerste rij is de header en wordt pas in data_cleanup gezet
+    raw = pd.read_csv(raw_path, sep=SEP, header=None, dtype=str, engine="pyarrow" if HAVE_PYARROW else "c")
+    print(f"- Ruwe data geladen: {raw.shape[0]} rijen x {raw.shape[1]} kolommen\n")
+    return raw
+
+def compile_pii_matcher(patterns: dict[str, str] = PII_PATTERNS) -> re.Pattern:
+    # Eén alternatie met named groups: één scan per cel, ongeacht het aantal regels
+    return re.compile("|".join(f"(?P<{name}>{rx})" for name, rx in patterns.items()))
+
+
+def redact_pii(df: pd.DataFrame, matcher: re.Pattern | None = None) -> tuple[pd.DataFrame, dict[str, int]]:
+    """
+    Lakt cellen met PII weg (wordt "") in één regex-pass en telt per patroon
+    het aantal cellen met een hit. Elke unieke waarde wordt maar één keer gescand;
+    bij categoricals de categorieën, die na het weglakken ook verdwijnen.
+    """
+    matcher = matcher or compile_pii_matcher()
+    hits = {name: 0 for name in matcher.groupindex}
+    out = df.copy()
+
+    for col in df.columns:
+        series = df[col]
+        # Alleen numerieke, bool-, datum- en tijdsduur-kolommen kunnen geen e-mail/IP bevatten
+        if (
+            is_numeric_dtype(series.dtype)
+            or is_datetime64_any_dtype(series.dtype)
+            or is_timedelta64_dtype(series.dtype)
+        ):
+            continue
+
+        is_categorical = isinstance(series.dtype, pd.CategoricalDtype)
+        if is_categorical:
+            codes, uniques = series.cat.codes.to_numpy(), series.cat.categories
+        else:
+            codes, uniques = pd.factorize(series)
+        if len(uniques) == 0:
+            continue
+
+        cell_counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+        flagged = np.zeros(len(uniques), dtype=bool)
+
+        for i, value in enumerate(uniques):
+            names = {
+                name
+                for m in matcher.finditer(str(value))
+                for name, found in m.groupdict().items()
+                if found is not None
+            }
+            if names:
+                flagged[i] = True
+                for name in names:
+                    hits[name] += int(cell_counts[i])
+
+        if flagged.any():
+            mask = (codes >= 0) & flagged[np.maximum(codes, 0)]
+            if is_categorical:
+                redacted = series.cat.add_categories([""]) if "" not in uniques else series.copy()
+                redacted[mask] = ""
+                # PII-waarden ook uit de categorieën (en dus uit bv. Parquet-dictionaries) halen
+                out[col] = redacted.cat.remove_categories(list(uniques[flagged]))
+            else:
+                out[col] = out[col].astype(object)
+                out.loc[mask, col] = ""
+
+    return out, hits
+
+
+def data_cleanup(raw: pd.DataFrame, debug_path: str | None = None) -> pd.DataFrame:
+    print("Cleanup Qualtrics data...")
+
+    # Header instellen
+    header_row = raw.iloc[0].astype(str).tolist()
+    data = raw.iloc[1:].copy()
+    data.columns = header_row
+
+    # Verwijder alle "label/vraagtekst"-rijen boven de eerste echte response rij
+    resp_candidates = ["ResponseId", "ResponseID", "responseid"]
+    resp_col = next((c for c in resp_candidates if c in data.columns), None)
+
+    # Regex voor ResponseId
+    resp_re = re.compile(r"^R_[A-Za-z0-9]+$")
+
+    resp_series = data[resp_col].fillna("").astype(str).str.strip()
+    data_row_mask = resp_series.str.match(resp_re)
+
+    first_data_pos = data_row_mask.idxmax()
+    clean_data = data.loc[first_data_pos:].copy()
+    clean_data = clean_data.dropna(how="all")
+
+    n_dropped = (data.index.get_loc(first_data_pos))  # aantal rijen erboven
+    print(f"- Label/vraagtekst-rijen verwijderd boven eerste response: {n_dropped}")
+
+    print(f"- Overgebleven rijen: {len(clean_data)}")
+    print(f"- Kolommen: {len(clean_data.columns)}\n")
+
+    if debug_path:
+        clean_data.to_csv(debug_path, sep=SEP, index=False)
+        print(f"- Clean data geschreven naar: {debug_path}\n")
+
+    return clean_data
+
+def data_avg_proof(df: pd.DataFrame, debug_path: str | None = None) -> pd.DataFrame:
+    print("AVG-proof...")
+
+    # PII-kolommen verwijderen (zelfde lijst als bij het inlezen van de export)
+    col_to_delete = list(PII_COLUMNS)
+
+    present = [c for c in col_to_delete if c in df.columns]
+    print("\n- Kolommen die als PII worden verwijderd:")
+    if present:
+        for c in present:
+            print(f"  • {c}")
+        df = df.drop(columns=present)
+    else:
+        print("  • (Geen van de geconfigureerde PII-kolommen gevonden)")
+
+    print(f"\n- Na kolommen verwijderen: {df.shape[0]} rijen x {df.shape[1]} kolommen")
+
+    # PII waardes verwijderen in alle overgebleven kolommen (tellen en weglakken in één scan)
+    df, hits = redact_pii(df)
+
+    print("\n- PII-controles in overgebleven kolommen (weggelakt):")
+    for name, n in hits.items():
+        print(f"  • Cellen met {name:<6}: {n}")
+
+    print(f"\n- Na AVG-proof: {df.shape[0]} rijen x {df.shape[1]} kolommen")
+
+    if debug_path:
+        df.to_csv(debug_path, sep=SEP, index=False)
+        print(f"- AVG-proof bestand geschreven naar: {debug_path}\n")
+
+    return df
+
+def data_unpivot(df: pd.DataFrame, debug_path: str | None = None, qids: list[str] | None = None) -> pd.DataFrame:
+    """
+    Unpivot naar (ResponsID, QuestionID, Answer) als categoricals. Lege antwoorden
+    worden tijdens de unpivot al overgeslagen; met qids blijven alleen die vragen over.
+    """
+    print("Data unpivot...")
+
+    # Zoek ResponseId-kolom
+    resp_candidates = ["ResponseId", "ResponseID", "responseid", "Response ID"]
+    resp_col = next((c for c in resp_candidates if c in df.columns), None)
+
+    # Waardes naar String
+    resp_series = (
+        df[resp_col]
+        .astype("string")
+        .str.strip()
+    )
+
+    # Filter: alleen niet-leeg en niet-NA
+    valid_mask = resp_series.notna() & (resp_series != "")
+
+    # Alleen rijen met ResponseId
+    work = df[valid_mask]
+    question_cols = [c for c in work.columns if c != resp_col]
+    if qids is not None:
+        keep_qids = set(qids)
+        question_cols = [c for c in question_cols if c in keep_qids]
+
+    # Unpivot per vraag (zelfde volgorde als melt), alleen niet-lege antwoorden
+    resp_cat = pd.Categorical(resp_series[valid_mask])
+    row_parts, col_parts, answer_parts = [], [], []
+    for i, col in enumerate(question_cols):
+        answers = work[col].astype("string").str.strip()
+        keep = (answers.notna() & (answers != "")).to_numpy()
+        rows = np.flatnonzero(keep)
+        row_parts.append(rows)
+        col_parts.append(np.full(len(rows), i))
+        answer_parts.append(answers.to_numpy(dtype=object)[rows])
+
+    rows = np.concatenate(row_parts) if row_parts else np.array([], dtype=int)
+    cols = np.concatenate(col_parts) if col_parts else np.array([], dtype=int)
+    answers = np.concatenate(answer_parts) if answer_parts else np.array([], dtype=object)
+
+    final_df = pd.DataFrame({
+        "ResponsID": pd.Categorical.from_codes(resp_cat.codes[rows], resp_cat.categories),
+        "QuestionID": pd.Categorical.from_codes(cols, categories=question_cols),
+        "Answer": pd.Categorical(answers),
+    })
+
+    if debug_path:
+        final_df.to_csv(debug_path, sep=SEP, index=False)
+
+    return final_df
+
+def run_pipeline(raw: pd.DataFrame, debug: bool = WRITE_DEBUG_CSV, qids: list[str] | None = KEEP_QIDS) -> pd.DataFrame:
+    """
+    Cleanup -> AVG-proof -> unpivot in geheugen. Geeft de long-tabel terug
+    (ResponsID, QuestionID, Answer); CSV-dumps per stap alleen met debug=True.
+    """
+    clean = data_cleanup(raw, CLEAN_CSV if debug else None)
+    avg = data_avg_proof(clean, AVG_CSV if debug else None)
+    return data_unpivot(avg, FINAL_CSV if debug else None, qids=qids)
+
+def write_long(df: pd.DataFrame, path: str | None = None) -> str:
+    """
+    Slaat de long-tabel getypeerd op als Parquet (met pyarrow; categoricals blijven
+    dictionary-encoded), anders als CSV.
+    """
+    if path is None:
+        path = FINAL_PARQUET if HAVE_PYARROW else FINAL_CSV
+
+    if path.endswith(".parquet"):
+        df.to_parquet(path, index=False)
+    else:
+        df.to_csv(path, sep=SEP, index=False)
+
+    print(f"- Long-tabel geschreven naar: {path}\n")
+    return path
+
+def main():
+    raw = data_extract(RAW_CSV)
+    final = run_pipeline(raw)
+    write_long(final)
+
+
+if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,56 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+
+class MultiSurveyPoller:
+    """
+    Pollt meerdere surveys gelijktijdig. Elke QualtricsPoller draait zijn
+    export/status/download-cycle in een worker-thread; de clients delen één HTTP-pool
+    en één limiter voor het globale maximum aan Qualtrics-requests. Een cycle duurt
+    daardoor ongeveer zo lang als de traagste survey.
+    """
+
+    def __init__(self, pollers: List, logger, scan_worker=None):
+        self.pollers = pollers
+        self.logger = logger
+        # Eén scan na alle surveys: de answers-tabel is gedeeld
+        self.scan_worker = scan_worker
+        # Vaste threads over alle cycles heen: elke thread houdt één lees-connectie
+        # van de Database, dus het aantal connecties blijft begrensd
+        self._executor = ThreadPoolExecutor(max_workers=len(pollers), thread_name_prefix="survey")
+
+    def close(self) -> None:
+        self._executor.shutdown()
+
+    def run_once(self) -> Dict:
+        return asyncio.run(self._run_all())
+
+    async def _run_all(self) -> Dict:
+        # run_in_executor met de eigen executor: asyncio.run sluit alleen de default executor af
+        loop = asyncio.get_running_loop()
+        results = await asyncio.gather(
+            *(loop.run_in_executor(self._executor, p.run_once) for p in self.pollers),
+            return_exceptions=True,
+        )
+
+        stats = {"inserted": 0, "updated": 0, "unchanged": 0, "bytes_written": 0, "surveys": {}, "failed": []}
+        for poller, result in zip(self.pollers, results):
+            if isinstance(result, BaseException):
+                self.logger.error(
+                    f"Survey {poller.survey_id} gefaald",
+                    exc_info=(type(result), result, result.__traceback__),
+                )
+                stats["failed"].append(poller.survey_id)
+                continue
+
+            stats["surveys"][poller.survey_id] = result
+            for key in ("inserted", "updated", "unchanged", "bytes_written"):
+                stats[key] += result[key]
+
+        if len(stats["failed"]) == len(self.pollers):
+            raise RuntimeError("Alle surveys gefaald")
+
+        if self.scan_worker is not None:
+            stats["scan"] = await loop.run_in_executor(self._executor, self.scan_worker.run_once)
+        return stats
@@ -0,0 +1,352 @@
+"""
+Benchmark van de pijplijn op een synthetische Qualtrics-export (zonder live API).
+
+Genereert een export-ZIP in Qualtrics-vorm (header, vraagtekst-rij, ImportId-rij,
+metadata- en PII-kolommen, een instelbaar aandeel PII-cellen) en meet per stage
+de tijd (beste/mediaan van --repeat runs) en het piekgeheugen (max RSS in een aparte,
+geforkte run; telt ook pyarrow/Arrow-allocaties mee, die tracemalloc niet ziet).
+Resultaat gaat als JSON naar --output; met --compare wordt tegen een eerdere baseline vergeleken.
+
+    python benchmark.py --responses 20000 --questions 60 --output benchmark_baseline.json
+    python benchmark.py --compare benchmark_baseline.json
+"""
+import argparse
+import io
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import statistics
+import sys
+import tempfile
+import time
+import zipfile
+from contextlib import redirect_stdout
+from datetime import datetime, timezone
+
+import pandas as pd
+
+import CollectieveKracht_ZelfscanScript_V2 as zelfscan
+import CollectieveKracht_VisualsScript as visuals
+from poller.csv_handler import CsvHandler, HAVE_PYARROW
+from poller.database import Database
+from poller.poller import QualtricsPoller
+from poller.scan_worker import ScanWorker
+
+DEFAULT_OUTPUT = "benchmark_baseline.json"
+
+META_COLUMNS = [
+    "StartDate", "EndDate", "Status", "IPAddress", "Progress", "Duration (in seconds)",
+    "Finished", "RecordedDate", "ResponseId", "RecipientLastName", "RecipientFirstName",
+    "RecipientEmail", "ExternalReference", "LocationLatitude", "LocationLongitude",
+    "DistributionChannel", "UserLanguage",
+]
+
+
+def generate_export(responses: int, questions: int, groups: int = 5, pii_share: float = 0.01, seed: int = 0) -> bytes:
+    """
+    Bouwt een export-ZIP zoals Qualtrics die levert (één CSV, komma-gescheiden).
+    Vragen zijn Q1..Qn plus de vragen die de visuals gebruiken; Q<groep> krijgt
+    `groups` waarden. Een aandeel `pii_share` van de antwoordcellen bevat een e-mail of IP.
+    """
+    rnd = random.Random(seed)
+    qids = [f"Q{i}" for i in range(1, questions + 1)]
+    qids += [q for q in [visuals.GROUP_BY_QID, *visuals.ANALYZE_QIDS] if q not in qids]
+    columns = META_COLUMNS + qids
+
+    out = io.StringIO()
+    out.write(",".join(columns) + "\n")
+    out.write(",".join(f'"Vraagtekst {c}"' for c in columns) + "\n")
+    out.write(",".join(f'"{{""ImportId"":""{c}""}}"' for c in columns) + "\n")
+
+    for i in range(responses):
+        row = [
+            "2024-01-01 10:00:00", "2024-01-01 10:05:00", "0", f"10.0.{i % 250}.{i % 200}", "100",
+            str(rnd.randint(60, 900)), "True", "2024-01-01 10:05:01", f"R_{i:015d}",
+            "Jansen", "Jan", f"jan{i}@example.nl", "", "52.09", "5.12", "anonymous", "NL",
+        ]
+        for q in qids:
+            if q == visuals.GROUP_BY_QID:
+                row.append(f"Groep {rnd.randrange(groups) + 1}")
+            elif rnd.random() < pii_share:
+                row.append(f"mail{i}@example.nl" if rnd.random() < 0.5 else f"192.168.{i % 250}.{rnd.randrange(250)}")
+            elif rnd.random() < 0.1:
+                row.append("")
+            else:
+                row.append(str(rnd.randint(1, 5)))
+        out.write(",".join(row) + "\n")
+
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as z:
+        z.writestr("Zelfscan.csv", out.getvalue())
+    return buf.getvalue()
+
+
+def export_to_raw_csv(export: bytes, path: str) -> None:
+    """
+    Schrijft de export als ;-gescheiden ruwe CSV, zoals data_extract die inleest.
+    """
+    with zipfile.ZipFile(io.BytesIO(export)) as z:
+        raw = pd.read_csv(z.open(z.namelist()[0]), header=None, dtype=str)
+    raw.to_csv(path, sep=zelfscan.SEP, header=False, index=False)
+
+
+class _FileExport:
+    """
+    Levert een vaste export-ZIP aan de poller in plaats van de Qualtrics API.
+    """
+
+    def __init__(self, data: bytes):
+        self.data = data
+
+    def run_export(self):
+        return io.BytesIO(self.data)
+
+    def commit(self) -> None:
+        pass
+
+
+def _quiet_logger() -> logging.Logger:
+    logger = logging.getLogger("benchmark")
+    logger.addHandler(logging.NullHandler())
+    logger.propagate = False
+    return logger
+
+
+def _max_rss_kib() -> int:
+    # Linux: ru_maxrss in KiB
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def peak_rss(fn, setup=None) -> tuple[int, int]:
+    """
+    Draait fn(setup()) één keer in een geforkt kindproces en geeft (max RSS van het
+    kind, groei van de max RSS tijdens fn) in KiB terug. Een vers proces per stage
+    voorkomt dat de piek van een eerdere stage de meting maskeert. Een exception in
+    het kind of een gestopt kind (bv. OOM-kill) geeft een RuntimeError.
+    """
+    ctx = multiprocessing.get_context("fork")
+    recv, send = ctx.Pipe(duplex=False)
+
+    def child():
+        try:
+            arg = setup() if setup else None
+            before = _max_rss_kib()
+            with redirect_stdout(io.StringIO()):
+                fn(arg) if setup else fn()
+            after = _max_rss_kib()
+            send.send((after, after - before, None))
+        except BaseException as e:
+            send.send((None, None, f"{type(e).__name__}: {e}"))
+        finally:
+            send.close()
+
+    proc = ctx.Process(target=child)
+    proc.start()
+    # Alleen het kind houdt het schrijf-einde open: sterft het, dan geeft recv() EOFError
+    send.close()
+    try:
+        after, delta, error = recv.recv()
+    except EOFError:
+        after = delta = error = None
+    finally:
+        recv.close()
+    proc.join()
+
+    if error is not None:
+        raise RuntimeError(f"RSS-meting gefaald: {error}")
+    if after is None:
+        raise RuntimeError(f"RSS-meting gefaald: kindproces gestopt met exitcode {proc.exitcode}")
+    return after, delta
+
+
+def measure(fn, setup=None, repeat: int = 3) -> dict:
+    """
+    Tijd (beste en mediaan over `repeat` runs) en piek-RSS van fn(setup()).
+    De RSS wordt in een aparte run in een kindproces gemeten. Een fout geeft een
+    entry met alleen "error", zodat de overige stages nog gemeten worden.
+    """
+    times = []
+    try:
+        for _ in range(repeat):
+            arg = setup() if setup else None
+            start = time.perf_counter()
+            with redirect_stdout(io.StringIO()):
+                result = fn(arg) if setup else fn()
+            times.append(time.perf_counter() - start)
+        peak, delta = peak_rss(fn, setup)
+    except Exception as e:
+        return {"error": f"{type(e).__name__}: {e}"}
+
+    entry = {
+        "seconds_min": round(min(times), 4),
+        "seconds_median": round(statistics.median(times), 4),
+        "peak_rss_mib": round(peak / 1024, 2),
+        "rss_delta_mib": round(delta / 1024, 2),
+    }
+    if isinstance(result, (pd.DataFrame, pd.Series, list)):
+        entry["rows"] = len(result)
+    return entry
+
+
+def run_benchmarks(args) -> dict:
+    logger = _quiet_logger()
+    export = generate_export(args.responses, args.questions, args.groups, args.pii_share, args.seed)
+    results = {}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_handler = CsvHandler(logger)
+        results["extract_dataframe"] = measure(lambda: csv_handler.extract_dataframe(export), repeat=args.repeat)
+
+        def fresh_db():
+            path = os.path.join(tmp, f"bench_{time.perf_counter_ns()}.db")
+            db = Database(logger, path=path)
+            db.initialize()
+            return db
+
+        def poll(db):
+            stats = QualtricsPoller(_FileExport(export), csv_handler, db, logger).run_once()
+            db.close()
+            return stats
+
+        results["poller_run_once"] = measure(poll, setup=fresh_db, repeat=args.repeat)
+
+        def ingested_db():
+            db = fresh_db()
+            QualtricsPoller(_FileExport(export), csv_handler, db, logger).run_once()
+            return db
+
+        def scan(db):
+            stats = ScanWorker(db, logger).run_once()
+            db.close()
+            return stats
+
+        results["scan_worker"] = measure(scan, setup=ingested_db, repeat=args.repeat)
+
+        scanned = ingested_db()
+        ScanWorker(scanned, logger).run_once()
+        results["answer_counts_sql"] = measure(
+            lambda: scanned.answer_counts(visuals.GROUP_BY_QID, visuals.ANALYZE_QIDS), repeat=args.repeat
+        )
+        scanned.close()
+
+        raw_path = os.path.join(tmp, "raw.csv")
+        export_to_raw_csv(export, raw_path)
+        with redirect_stdout(io.StringIO()):
+            raw = zelfscan.data_extract(raw_path)
+            clean = zelfscan.data_cleanup(raw)
+            avg = zelfscan.data_avg_proof(clean)
+            long_df = zelfscan.data_unpivot(avg)
+
+        results["zelfscan_extract"] = measure(lambda: zelfscan.data_extract(raw_path), repeat=args.repeat)
+        results["zelfscan_cleanup"] = measure(lambda: zelfscan.data_cleanup(raw), repeat=args.repeat)
+        results["zelfscan_avg_proof"] = measure(lambda: zelfscan.data_avg_proof(clean), repeat=args.repeat)
+        results["zelfscan_unpivot"] = measure(lambda: zelfscan.data_unpivot(avg), repeat=args.repeat)
+
+        def aggregate():
+            df = visuals.prepare_long(long_df)
+            group_map = visuals.build_group_map(df, visuals.GROUP_BY_QID)
+            return visuals.build_count_cube(df, group_map, visuals.ANALYZE_QIDS)
+
+        results["visuals_aggregation"] = measure(aggregate, repeat=args.repeat)
+
+    return {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "params": {
+            "responses": args.responses,
+            "questions": args.questions,
+            "groups": args.groups,
+            "pii_share": args.pii_share,
+            "seed": args.seed,
+            "repeat": args.repeat,
+            "export_bytes": len(export),
+        },
+        "environment": {
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "pyarrow": HAVE_PYARROW,
+            "platform": platform.platform(),
+        },
+        "results": results,
+    }
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> list[str]:
+    """
+    Stages waarvan de beste tijd meer dan `tolerance` keer zo traag is als in de baseline.
+    """
+    if current["params"] != baseline.get("params"):
+        print("Let op: parameters wijken af van de baseline; vergelijking is indicatief.")
+
+    regressions = []
+    for stage, entry in current["results"].items():
+        if "error" in entry:
+            regressions.append(stage)
+            continue
+        base = baseline.get("results", {}).get(stage)
+        if not base or not base.get("seconds_min"):
+            continue
+        ratio = entry["seconds_min"] / base["seconds_min"]
+        print(f"{stage:<22} {base['seconds_min']:8.4f}s -> {entry['seconds_min']:8.4f}s  x{ratio:.2f}")
+        if ratio > tolerance:
+            regressions.append(stage)
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark op een synthetische Qualtrics-export.")
+    parser.add_argument("--responses", type=int, default=10_000)
+    parser.add_argument("--questions", type=int, default=60)
+    parser.add_argument("--groups", type=int, default=5)
+    parser.add_argument("--pii-share", type=float, default=0.01)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    parser.add_argument("--compare", help="eerdere baseline; parameters worden daaruit overgenomen")
+    parser.add_argument("--tolerance", type=float, default=1.25)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        for key in ("responses", "questions", "groups", "pii_share", "seed"):
+            setattr(args, key, baseline["params"][key])
+
+    report = run_benchmarks(args)
+
+    for stage, entry in report["results"].items():
+        if "error" in entry:
+            print(f"{stage:<22} FOUT: {entry['error']}")
+            continue
+        print(
+            f"{stage:<22} min {entry['seconds_min']:8.4f}s  median {entry['seconds_median']:8.4f}s  "
+            f"peak RSS {entry['peak_rss_mib']:8.2f} MiB (+{entry['rss_delta_mib']:.2f})"
+        )
+
+    if baseline is not None:
+        regressions = compare(report, baseline, args.tolerance)
+        if regressions:
+            print(f"Regressies (> x{args.tolerance}): {', '.join(regressions)}")
+            sys.exit(1)
+        return
+
+    failed = [stage for stage, entry in report["results"].items() if "error" in entry]
+    if failed:
+        print(f"Gefaalde stages: {', '.join(failed)}; geen baseline geschreven")
+        sys.exit(1)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Baseline geschreven naar: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,12 +3,100 @@ import os
 QUALTRICS_API_TOKEN = os.getenv("QUALTRICS_API_TOKEN")
 QUALTRICS_DATACENTER = os.getenv("QUALTRICS_DATA_CENTER")
 SURVEY_ID = os.getenv("QUALTRICS_SURVEY_ID")
+# Meerdere surveys in één proces (komma-gescheiden); valt terug op QUALTRICS_SURVEY_ID
+SURVEY_IDS = tuple(
+    s.strip() for s in os.getenv("SURVEY_IDS", SURVEY_ID or "").split(",") if s.strip()
+)
 
 DB_PATH = "data/qualtrics.db"
+# SQLite tuning (WAL staat altijd aan)
+DB_BUSY_TIMEOUT = float(os.getenv("DB_BUSY_TIMEOUT", "30"))
+DB_SYNCHRONOUS = os.getenv("DB_SYNCHRONOUS", "NORMAL")
+DB_CACHE_SIZE = int(os.getenv("DB_CACHE_SIZE", "-20000"))  # negatief = KiB
+DB_MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", str(256 * 1024 * 1024)))
+DB_BATCH_SIZE = int(os.getenv("DB_BATCH_SIZE", "1000"))
+# Vluchtige velden die niet meetellen in de content-hash (komma-gescheiden)
+HASH_IGNORE_FIELDS = tuple(f for f in os.getenv("HASH_IGNORE_FIELDS", "").split(",") if f)
+
+# Scan worker: aantal responses per batch en max. pogingen voor rijen met een fout
+SCAN_BATCH_SIZE = int(os.getenv("SCAN_BATCH_SIZE", "500"))
+SCAN_MAX_ATTEMPTS = int(os.getenv("SCAN_MAX_ATTEMPTS", "3"))
+
+# Aantal CSV-rijen per batch bij het streamen van de export
+CSV_CHUNK_SIZE = int(os.getenv("CSV_CHUNK_SIZE", "5000"))
+
+# Schema van de export-CSV: deze kolommen als string (IDs, datums, vrije tekst),
+# alle overige kolommen (antwoordcodes) als category
+CSV_STRING_COLUMNS = (
+    "ResponseId",
+    "StartDate",
+    "EndDate",
+    "RecordedDate",
+    "Duration (in seconds)",
+    "ExternalReference",
+    "DistributionChannel",
+    "UserLanguage",
+)
+# PII-kolommen (metadata en persoonsvragen van de survey); data_avg_proof verwijdert ze
+PII_COLUMNS = (
+    "IPAddress",
+    "RecipientLastName",
+    "RecipientFirstName",
+    "RecipientEmail",
+    "Q2 ",
+    "Q3",
+    "Q4",
+    "Q5",
+    "Q5_1",
+    "Q9",
+)
+# Kolommen die al bij het inlezen worden overgeslagen (komen nooit in responses.data)
+CSV_DROP_COLUMNS = PII_COLUMNS + (
+    "LocationLatitude",
+    "LocationLongitude",
+)
+
 LOG_DIR = "logs"
+# Handlers via een QueueListener-thread: log-I/O blokkeert de poller niet
+LOG_QUEUE = os.getenv("LOG_QUEUE", "0") == "1"
+# "text" of "json" (één JSON-object per regel)
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+# Meldingen met extra={"rate_limit": ...} (voortgang, stdout-dumps) max. één keer per
+# zoveel seconden; 0 = uit
+LOG_RATE_LIMIT_SECONDS = float(os.getenv("LOG_RATE_LIMIT_SECONDS", "0"))
 
 POLL_INTERVAL_SECONDS = 60
+# Grenzen voor het adaptieve poll-interval (korter bij nieuwe responses, langer bij stilte)
+POLL_INTERVAL_MIN_SECONDS = float(os.getenv("POLL_INTERVAL_MIN_SECONDS", "30"))
+POLL_INTERVAL_MAX_SECONDS = float(os.getenv("POLL_INTERVAL_MAX_SECONDS", "600"))
+POLL_BACKOFF = float(os.getenv("POLL_BACKOFF", "1.5"))
+
+# Lokale HTTP-server voor o.a. POST /trigger (0 = uit)
+CONTROL_HOST = os.getenv("CONTROL_HOST", "127.0.0.1")
+CONTROL_PORT = int(os.getenv("CONTROL_PORT", "8080"))
+
+# Incrementele export via Qualtrics continuation tokens (alleen nieuwe responses)
+EXPORT_INCREMENTAL = os.getenv("EXPORT_INCREMENTAL", "1") == "1"
+
+# Adaptief pollen van de exportstatus
+EXPORT_POLL_MIN_INTERVAL = float(os.getenv("EXPORT_POLL_MIN_INTERVAL", "0.5"))
+EXPORT_POLL_MAX_INTERVAL = float(os.getenv("EXPORT_POLL_MAX_INTERVAL", "15"))
+EXPORT_POLL_BACKOFF = float(os.getenv("EXPORT_POLL_BACKOFF", "1.5"))
+EXPORT_TIMEOUT_SECONDS = float(os.getenv("EXPORT_TIMEOUT_SECONDS", "600"))
 
 TIMEOUT_EXPORT_START = 30
 TIMEOUT_STATUS_CHECK = 30
 TIMEOUT_FILE_DOWNLOAD = 60
+
+# HTTP retry/backoff voor de Qualtrics API (429 en 5xx, Retry-After wordt gerespecteerd)
+HTTP_RETRY_TOTAL = int(os.getenv("HTTP_RETRY_TOTAL", "5"))
+HTTP_RETRY_BACKOFF = float(os.getenv("HTTP_RETRY_BACKOFF", "1.0"))
+HTTP_RETRY_STATUSES = (429, 500, 502, 503, 504)
+# Max. gelijktijdige Qualtrics-requests over alle surveys samen (rate limit)
+QUALTRICS_MAX_CONCURRENT_REQUESTS = int(os.getenv("QUALTRICS_MAX_CONCURRENT_REQUESTS", "4"))
+HTTP_POOL_SIZE = max(4, QUALTRICS_MAX_CONCURRENT_REQUESTS)
+
+# Download wordt gestreamd; boven deze grootte spilt het tijdelijke bestand naar schijf
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+DOWNLOAD_SPOOL_MAX_BYTES = int(os.getenv("DOWNLOAD_SPOOL_MAX_BYTES", str(64 * 1024 * 1024)))
+DOWNLOAD_MAX_RESUMES = 3
@@ -0,0 +1,36 @@
+import threading
+
+from flask import Flask
+from werkzeug.serving import make_server
+
+from config import CONTROL_HOST, CONTROL_PORT
+
+
+def create_app(scheduler, metrics=None) -> Flask:
+    app = Flask(__name__)
+
+    @app.post("/trigger")
+    def trigger():
+        scheduler.trigger("http")
+        return {"status": "triggered"}, 202
+
+    if metrics is not None:
+        @app.get("/metrics")
+        def prometheus_metrics():
+            return metrics.render(), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
+    return app
+
+
+def start_control_server(scheduler, logger, host: str = CONTROL_HOST, port: int = CONTROL_PORT, metrics=None):
+    """
+    Start een lokale HTTP-server (daemon thread) waarmee een cycle kan worden getriggerd:
+    POST /trigger. Met metrics ook GET /metrics (Prometheus). Port 0 = uitgeschakeld.
+    """
+    if not port:
+        return None
+
+    server = make_server(host, port, create_app(scheduler, metrics), threaded=True)
+    threading.Thread(target=server.serve_forever, name="control-server", daemon=True).start()
+    logger.info(f"Control server luistert op http://{host}:{port}")
+    return server
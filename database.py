@@ -1,34 +1,194 @@
+import hashlib
+import json
 import sqlite3
+import threading
+from contextlib import closing, contextmanager
 from datetime import datetime, timezone
-from typing import Optional, List, Tuple
-from config import DB_PATH
+from itertools import islice
+from typing import Dict, Iterable, Optional, List, Tuple, Union
+
+import pandas as pd
+
+from config import (
+    DB_PATH,
+    DB_BATCH_SIZE,
+    DB_BUSY_TIMEOUT,
+    DB_SYNCHRONOUS,
+    DB_CACHE_SIZE,
+    DB_MMAP_SIZE,
+    SCAN_MAX_ATTEMPTS,
+    HASH_IGNORE_FIELDS,
+    SURVEY_ID,
+)
+
+
+# Alleen bij een andere content-hash wordt de rij herschreven (en opnieuw NEW)
+UPSERT_SQL = """
+    INSERT INTO responses (ResponseId, survey_id, data, data_hash, created_at, updated_at, scan_status)
+    VALUES (?, ?, ?, ?, ?, ?, 'NEW')
+    ON CONFLICT(ResponseId) DO UPDATE SET
+        survey_id = excluded.survey_id,
+        data = excluded.data,
+        data_hash = excluded.data_hash,
+        updated_at = excluded.updated_at,
+        scan_status = 'NEW',
+        scan_attempts = 0
+    WHERE responses.data_hash IS NOT excluded.data_hash
+"""
+
+STATE_UPSERT_SQL = """
+    INSERT INTO state (key, value, updated_at)
+    VALUES (?, ?, ?)
+    ON CONFLICT(key) DO UPDATE SET
+        value = excluded.value,
+        updated_at = excluded.updated_at
+"""
+
+# state-key met het tijdstip van de laatste scan; per survey met ":<survey_id>" erachter
+LAST_SCAN_KEY = "last_scanned_at"
+
+
+def last_scan_key(survey_id: Optional[str] = None) -> str:
+    return LAST_SCAN_KEY if survey_id is None else f"{LAST_SCAN_KEY}:{survey_id}"
+
+
+def content_hash(data: str, ignore_fields=HASH_IGNORE_FIELDS) -> str:
+    """
+    Hash van de response-inhoud. Velden in HASH_IGNORE_FIELDS (vluchtige velden)
+    tellen niet mee; zonder zulke velden wordt de JSON-tekst direct gehasht.
+    """
+    if ignore_fields:
+        obj = json.loads(data)
+        for field in ignore_fields:
+            obj.pop(field, None)
+        data = json.dumps(obj, sort_keys=True)
+    return hashlib.blake2b(data.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def iter_response_rows(df: pd.DataFrame) -> Iterable[Tuple[str, str]]:
+    """
+    Zet een export-DataFrame om naar (ResponseId, json) paren.
+    Alleen echte responses (ResponseId begint met "R_") worden meegenomen.
+    """
+    if df.empty or "ResponseId" not in df.columns:
+        return
+    # Eén to_json over het hele frame; per regel identiek aan row.to_json()
+    lines = df.to_json(orient="records", lines=True).rstrip("\n").split("\n")
+    for response_id, data in zip(df["ResponseId"].astype(str), lines):
+        if response_id.startswith("R_"):
+            yield response_id, data
 
 
 class Database:
-    def __init__(self, logger):
+    """
+    SQLite opslag met één langlevende schrijf-connectie (achter een lock) en een
+    lees-connectie per thread. WAL zorgt dat lezers de schrijver niet blokkeren.
+    """
+
+    def __init__(self, logger, path: str = DB_PATH):
         self.logger = logger
+        self.path = path
+        self._lock = threading.RLock()
+        self._writer_conn: Optional[sqlite3.Connection] = None
+        self._local = threading.local()
+        self._readers: List[sqlite3.Connection] = []
+
+    def __enter__(self) -> "Database":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=DB_BUSY_TIMEOUT, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"PRAGMA synchronous={DB_SYNCHRONOUS}")
+        conn.execute(f"PRAGMA cache_size={int(DB_CACHE_SIZE)}")
+        conn.execute(f"PRAGMA mmap_size={int(DB_MMAP_SIZE)}")
+        return conn
+
+    @contextmanager
+    def _write(self):
+        """
+        Geeft de schrijf-connectie binnen één transactie (commit of rollback bij fout).
+        """
+        with self._lock:
+            if self._writer_conn is None:
+                self._writer_conn = self._connect()
+            with self._writer_conn:
+                yield self._writer_conn
+
+    def _read(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+            with self._lock:
+                self._readers.append(conn)
+        return conn
+
+    def close(self) -> None:
+        with self._lock:
+            for conn in self._readers:
+                conn.close()
+            self._readers.clear()
+            self._local = threading.local()
+            if self._writer_conn is not None:
+                self._writer_conn.close()
+                self._writer_conn = None
 
     def initialize(self):
-        conn = sqlite3.connect(DB_PATH)
+        with self._write() as conn:
+            self._create_schema(conn)
+        self.logger.info("Database geinitialiseerd")
+
+    def _create_schema(self, conn: sqlite3.Connection) -> None:
         c = conn.cursor()
 
         c.execute("""
             CREATE TABLE IF NOT EXISTS responses (
                 ResponseId TEXT PRIMARY KEY,
+                survey_id TEXT,
                 data TEXT,
                 created_at TEXT,
                 updated_at TEXT,
                 scan_status TEXT DEFAULT 'NEW',
                 scanned_at TEXT,
-                scan_error TEXT
+                scan_error TEXT,
+                scan_attempts INTEGER DEFAULT 0,
+                data_hash TEXT
+            );
+        """)
+
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS state (
+                key TEXT PRIMARY KEY,
+                value TEXT,
+                updated_at TEXT
+            );
+        """)
+
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS answers (
+                ResponseId TEXT NOT NULL,
+                QuestionID TEXT NOT NULL,
+                Answer TEXT,
+                survey_id TEXT,
+                PRIMARY KEY (ResponseId, QuestionID)
             );
         """)
 
         self._migrate_add_missing_columns(conn)
 
-        conn.commit()
-        conn.close()
-        self.logger.info("Database geinitialiseerd")
+        # Scan-wachtrij: per status op volgorde van updated_at, zonder de hele tabel te lezen
+        c.execute("DROP INDEX IF EXISTS idx_responses_scan_status")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_responses_scan_queue ON responses (scan_status, updated_at)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_responses_survey ON responses (survey_id)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_answers_question ON answers (QuestionID)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_answers_question_answer ON answers (QuestionID, Answer)")
+        c.execute(
+            "CREATE INDEX IF NOT EXISTS idx_answers_survey_question_answer ON answers (survey_id, QuestionID, Answer)"
+        )
 
     def _migrate_add_missing_columns(self, conn: sqlite3.Connection) -> None:
         c = conn.cursor()
@@ -43,71 +203,273 @@ class Database:
         add_col("ALTER TABLE responses ADD COLUMN scan_status TEXT DEFAULT 'NEW'", "scan_status")
         add_col("ALTER TABLE responses ADD COLUMN scanned_at TEXT", "scanned_at")
         add_col("ALTER TABLE responses ADD COLUMN scan_error TEXT", "scan_error")
+        add_col("ALTER TABLE responses ADD COLUMN scan_attempts INTEGER DEFAULT 0", "scan_attempts")
+
+        if "survey_id" not in existing:
+            add_col("ALTER TABLE responses ADD COLUMN survey_id TEXT", "survey_id")
+            # Bestaande rijen komen uit de single-survey opzet
+            c.execute("UPDATE responses SET survey_id = ?", (SURVEY_ID,))
+
+        c.execute("PRAGMA table_info(answers)")
+        if "survey_id" not in {row[1] for row in c.fetchall()}:
+            self.logger.info("DB migratie: kolom toevoegen -> answers.survey_id")
+            c.execute("ALTER TABLE answers ADD COLUMN survey_id TEXT")
+            c.execute(
+                """
+                UPDATE answers SET survey_id = (
+                    SELECT r.survey_id FROM responses r WHERE r.ResponseId = answers.ResponseId
+                )
+                """
+            )
+
+        # Laatste scan-tijd eenmalig uit responses halen voor databases van vóór de state-key
+        if c.execute("SELECT 1 FROM state WHERE key = ?", (last_scan_key(),)).fetchone() is None:
+            c.execute(
+                "SELECT survey_id, MAX(scanned_at) FROM responses WHERE scan_status = 'DONE' GROUP BY survey_id"
+            )
+            per_survey = [(sid, ts) for sid, ts in c.fetchall() if ts]
+            if per_survey:
+                now = datetime.now(timezone.utc).isoformat()
+                c.executemany(
+                    STATE_UPSERT_SQL,
+                    [(last_scan_key(), max(ts for _, ts in per_survey), now)]
+                    + [(last_scan_key(sid), ts, now) for sid, ts in per_survey if sid],
+                )
 
-    def upsert(self, response_id: str, data: str):
+        if "data_hash" not in existing:
+            add_col("ALTER TABLE responses ADD COLUMN data_hash TEXT", "data_hash")
+            # Bestaande rijen een hash geven, anders worden ze allemaal als gewijzigd gezien
+            c.execute("SELECT ResponseId, data FROM responses")
+            c.executemany(
+                "UPDATE responses SET data_hash = ? WHERE ResponseId = ?",
+                [(content_hash(data), rid) for rid, data in c.fetchall() if data is not None],
+            )
+
+    def upsert(self, response_id: str, data: str, survey_id: Optional[str] = SURVEY_ID):
         now = datetime.now(timezone.utc).isoformat()
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
+        with self._write() as conn:
+            conn.execute(UPSERT_SQL, (response_id, survey_id, data, content_hash(data), now, now))
 
-        
-        c.execute(
-            """
-            INSERT INTO responses (ResponseId, data, created_at, updated_at, scan_status)
-            VALUES (?, ?, ?, ?, 'NEW')
-            ON CONFLICT(ResponseId) DO UPDATE SET
-                data = excluded.data,
-                updated_at = excluded.updated_at,
-                scan_status = CASE
-                    WHEN responses.data != excluded.data THEN 'NEW'
-                    ELSE responses.scan_status
-                END
-            """,
-            (response_id, data, now, now),
-        )
+    def upsert_many(
+        self,
+        rows: Union[pd.DataFrame, Iterable[Tuple[str, str]]],
+        chunk_size: int = DB_BATCH_SIZE,
+        survey_id: Optional[str] = SURVEY_ID,
+    ) -> Dict[str, int]:
+        """
+        Bulk-variant van upsert: per chunk één transactie met executemany. De chunk
+        (en dus het parsen van de bron) wordt buiten de schrijf-lock opgebouwd, zodat
+        gelijktijdige surveys alleen op de SELECT + executemany op elkaar wachten.
+        Een herhaalde ingest is idempotent dankzij de content-hash: ongewijzigde rijen
+        worden niet geschreven. Geeft het aantal inserted/updated/unchanged rijen en de
+        geschreven bytes terug.
+        """
+        if isinstance(rows, pd.DataFrame):
+            rows = iter_response_rows(rows)
+
+        stats = {"inserted": 0, "updated": 0, "unchanged": 0, "bytes_written": 0}
+        now = datetime.now(timezone.utc).isoformat()
+        it = iter(rows)
+
+        while True:
+            # Binnen een chunk wint de laatste versie van een ResponseId
+            chunk = {
+                response_id: (data, content_hash(data))
+                for response_id, data in islice(it, chunk_size)
+            }
+            if not chunk:
+                break
 
-        conn.commit()
-        conn.close()
+            ids = list(chunk)
+            placeholders = ",".join("?" * len(ids))
+
+            # Cursor binnen de lock sluiten: anders reset de opruiming ervan een statement
+            # van de gedeelde connectie terwijl een andere thread die gebruikt
+            with self._write() as conn, closing(conn.cursor()) as c:
+                c.execute(
+                    f"SELECT ResponseId, data_hash FROM responses WHERE ResponseId IN ({placeholders})",
+                    ids,
+                )
+                existing = dict(c.fetchall())
+
+                changed = []
+                for response_id, (data, data_hash) in chunk.items():
+                    if response_id not in existing:
+                        stats["inserted"] += 1
+                    elif existing[response_id] != data_hash:
+                        stats["updated"] += 1
+                    else:
+                        stats["unchanged"] += 1
+                        continue
+                    changed.append((response_id, survey_id, data, data_hash, now, now))
+                    stats["bytes_written"] += len(data)
+
+                if changed:
+                    c.executemany(UPSERT_SQL, changed)
+
+        return stats
 
     
-    def fetch_unscanned(self, limit: int = 500) -> List[Tuple[str, str]]:
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
+    def fetch_unscanned(
+        self, limit: int = 500, max_attempts: int = SCAN_MAX_ATTEMPTS, retried_before: Optional[str] = None
+    ) -> List[Tuple[str, str]]:
+        """
+        NEW-rijen, gevolgd door ERROR-rijen die nog minder dan max_attempts pogingen hebben.
+        Met retried_before (ISO-tijd) alleen ERROR-rijen die daarvoor voor het laatst
+        gescand zijn, zodat een scan-run dezelfde rij niet twee keer probeert.
+        Twee aparte queries, zodat beide via idx_responses_scan_queue lopen.
+        """
+        c = self._read().cursor()
         c.execute(
             """
             SELECT ResponseId, data
             FROM responses
-            WHERE COALESCE(scan_status, 'NEW') = 'NEW'
+            WHERE scan_status = 'NEW'
             ORDER BY updated_at ASC
             LIMIT ?
             """,
             (limit,),
         )
         rows = c.fetchall()
-        conn.close()
-        return rows
+        if len(rows) >= limit:
+            return rows
+
+        c.execute(
+            """
+            SELECT ResponseId, data
+            FROM responses
+            WHERE scan_status = 'ERROR'
+              AND COALESCE(scan_attempts, 0) < ?
+              AND (? IS NULL OR scanned_at IS NULL OR scanned_at < ?)
+            ORDER BY updated_at ASC
+            LIMIT ?
+            """,
+            (max_attempts, retried_before, retried_before, limit - len(rows)),
+        )
+        return rows + c.fetchall()
 
     
     def mark_scanned(self, response_id: str, status: str = "DONE", error: Optional[str] = None) -> None:
         now = datetime.now(timezone.utc).isoformat()
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
+        with self._write() as conn:
+            conn.execute(
+                """
+                UPDATE responses
+                SET scan_status = ?, scanned_at = ?, scan_error = ?
+                WHERE ResponseId = ?
+                """,
+                (status, now, error, response_id),
+            )
+
+    def store_scan_results(
+        self,
+        answers: Iterable[Tuple[str, str, Optional[str]]],
+        done_ids: List[str],
+        errors: Dict[str, str],
+    ) -> None:
+        """
+        Schrijft de long-format antwoorden van een scan-batch en markeert de rijen
+        DONE of ERROR, alles in één transactie met executemany.
+        """
+        now = datetime.now(timezone.utc).isoformat()
+        with self._write() as conn:
+            # Bestaande antwoorden van (opnieuw) gescande responses vervangen
+            conn.executemany("DELETE FROM answers WHERE ResponseId = ?", [(rid,) for rid in done_ids])
+            # survey_id overnemen van de response, zodat counts per survey kunnen
+            conn.executemany(
+                """
+                INSERT OR REPLACE INTO answers (ResponseId, QuestionID, Answer, survey_id)
+                VALUES (?, ?, ?, (SELECT survey_id FROM responses WHERE ResponseId = ?))
+                """,
+                ((rid, qid, answer, rid) for rid, qid, answer in answers),
+            )
+            conn.executemany(
+                """
+                UPDATE responses
+                SET scan_status = ?, scanned_at = ?, scan_error = ?,
+                    scan_attempts = COALESCE(scan_attempts, 0) + 1
+                WHERE ResponseId = ?
+                """,
+                [("DONE", now, None, rid) for rid in done_ids]
+                + [("ERROR", now, error, rid) for rid, error in errors.items()],
+            )
+
+            if done_ids:
+                # Laatste scan-tijd (totaal en per survey) voor de staleness-check van de visuals
+                surveys = set()
+                for i in range(0, len(done_ids), 500):
+                    chunk = done_ids[i:i + 500]
+                    surveys.update(
+                        row[0]
+                        for row in conn.execute(
+                            f"SELECT DISTINCT survey_id FROM responses WHERE ResponseId IN ({','.join('?' * len(chunk))})",
+                            chunk,
+                        )
+                    )
+                conn.executemany(
+                    STATE_UPSERT_SQL,
+                    [(last_scan_key(), now, now)] + [(last_scan_key(sid), now, now) for sid in surveys if sid],
+                )
+
+    def answer_counts(
+        self, group_qid: str, qids: List[str], survey_id: Optional[str] = None
+    ) -> List[Tuple[str, str, str, int]]:
+        """
+        Aantal antwoorden per (groep, vraag, antwoord), waarbij de groep het antwoord
+        op group_qid is. Eén geïndexeerde query; vervangt melt + merge in pandas.
+        Met survey_id alleen de antwoorden van die survey.
+        """
+        if not qids:
+            return []
+        placeholders = ",".join("?" * len(qids))
+        survey_filter = "AND a.survey_id = ?" if survey_id is not None else ""
+        params = [group_qid, *qids] + ([survey_id] if survey_id is not None else [])
+        c = self._read().cursor()
         c.execute(
-            """
-            UPDATE responses
-            SET scan_status = ?, scanned_at = ?, scan_error = ?
-            WHERE ResponseId = ?
+            f"""
+            SELECT g.Answer AS GroupValue, a.QuestionID, a.Answer, COUNT(*) AS Count
+            FROM answers a
+            JOIN answers g
+              ON g.ResponseId = a.ResponseId
+             AND g.QuestionID = ?
+            WHERE a.QuestionID IN ({placeholders})
+              AND a.Answer IS NOT NULL AND a.Answer != ''
+              AND g.Answer IS NOT NULL AND g.Answer != ''
+              {survey_filter}
+            GROUP BY g.Answer, a.QuestionID, a.Answer
             """,
-            (status, now, error, response_id),
+            params,
         )
-        conn.commit()
-        conn.close()
+        return c.fetchall()
 
-    def count(self) -> int:
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        c.execute("SELECT COUNT(*) FROM responses")
-        count = c.fetchone()[0]
-        conn.close()
-        return count
+    def get_state(self, key: str) -> Optional[str]:
+        c = self._read().cursor()
+        c.execute("SELECT value FROM state WHERE key = ?", (key,))
+        row = c.fetchone()
+        return row[0] if row else None
+
+    def set_state(self, key: str, value: Optional[str]) -> None:
+        now = datetime.now(timezone.utc).isoformat()
+        with self._write() as conn:
+            if value is None:
+                conn.execute("DELETE FROM state WHERE key = ?", (key,))
+            else:
+                conn.execute(STATE_UPSERT_SQL, (key, value, now))
+
+    def last_scanned_at(self, survey_id: Optional[str] = None) -> Optional[datetime]:
+        """
+        Tijdstip van de laatst gescande response (optioneel per survey). Wordt door
+        store_scan_results in de state-tabel bijgehouden: één key-lookup per cycle.
+        """
+        value = self.get_state(last_scan_key(survey_id))
+        return datetime.fromisoformat(value) if value else None
+
+    def count(self, survey_id: Optional[str] = None) -> int:
+        c = self._read().cursor()
+        if survey_id is None:
+            c.execute("SELECT COUNT(*) FROM responses")
+        else:
+            c.execute("SELECT COUNT(*) FROM responses WHERE survey_id = ?", (survey_id,))
+        return c.fetchone()[0]
 
    
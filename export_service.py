@@ -1,27 +1,107 @@
 import time
+from typing import BinaryIO, Optional
+
+import requests
+
+from config import (
+    EXPORT_INCREMENTAL,
+    EXPORT_POLL_MIN_INTERVAL,
+    EXPORT_POLL_MAX_INTERVAL,
+    EXPORT_POLL_BACKOFF,
+    EXPORT_TIMEOUT_SECONDS,
+)
+from poller.metrics import Metrics
 
 
 class ExportService:
-    def __init__(self, client, logger):
+    def __init__(
+        self, client, logger, state=None, incremental: bool = EXPORT_INCREMENTAL, metrics: Optional[Metrics] = None
+    ):
         self.client = client
         self.logger = logger
+        self.metrics = metrics or Metrics()
+        # state: object met get_state/set_state (de Database) voor het continuation token
+        self.state = state
+        self.incremental = incremental and state is not None
+        self._pending_token: Optional[str] = None
+        self.min_interval = EXPORT_POLL_MIN_INTERVAL
+        self.max_interval = EXPORT_POLL_MAX_INTERVAL
+        self.backoff = EXPORT_POLL_BACKOFF
+        self.timeout = EXPORT_TIMEOUT_SECONDS
+        self.last_status_calls = 0
+
+    @property
+    def token_key(self) -> str:
+        return f"continuation_token:{self.client.survey_id}"
+
+    def run_export(self) -> BinaryIO:
+        with self.metrics.timer("export"):
+            return self._run_export()
 
-    def run_export(self) -> bytes:
-        progress_id = self.client.start_export()
-        self.logger.info(f"Export gestart: {progress_id}")
+    def _run_export(self) -> BinaryIO:
+        token = self.state.get_state(self.token_key) if self.incremental else None
 
-        start_time = time.time()
+        try:
+            progress_id = self.client.start_export(
+                continuation_token=token, incremental=self.incremental
+            )
+        except requests.HTTPError as e:
+            # Verlopen/ongeldig token: terugvallen op een volledige export
+            if not token or e.response is None or e.response.status_code != 400:
+                raise
+            self.logger.warning("Continuation token ongeldig; volledige export wordt gestart")
+            self.state.set_state(self.token_key, None)
+            token = None
+            progress_id = self.client.start_export(incremental=True)
+
+        mode = "incrementeel" if token else "volledig"
+        self.logger.info(f"Export gestart ({mode}, {self.client.survey_id}): {progress_id}")
+
+        start_time = time.monotonic()
+        interval = self.min_interval
+        self.last_status_calls = 0
 
         while True:
             status = self.client.check_status(progress_id)
+            self.last_status_calls += 1
+            self.metrics.inc("export_status_calls")
             percent = status.get("percentComplete", 0)
+            elapsed = time.monotonic() - start_time
 
-            self.logger.info(f"Export voortgang: {percent}%")
+            self.logger.debug(f"Export voortgang: {percent}%", extra={"rate_limit": True})
 
             if percent == 100:
-                return self.client.download_file(status["fileId"])
+                self.logger.info(
+                    f"Export klaar na {elapsed:.1f}s ({self.last_status_calls} status-calls)"
+                )
+                self._pending_token = status.get("continuationToken") if self.incremental else None
+                with self.metrics.timer("download"):
+                    return self.client.download_file(status["fileId"])
+
+            if elapsed > self.timeout:
+                raise TimeoutError(f"Export duurde langer dan {self.timeout} seconden")
+
+            interval = self._next_interval(interval, elapsed, percent)
+            time.sleep(min(interval, max(self.timeout - elapsed, 0) + self.min_interval))
 
-            if time.time() - start_time > 600:
-                raise TimeoutError("Export duurde langer dan 10 minuten")
+    def _next_interval(self, interval: float, elapsed: float, percent: float) -> float:
+        """
+        Bepaalt de volgende wachttijd. Zodra er voortgang is wordt de resterende tijd
+        geschat uit het tempo (percent / elapsed) en halverwege opnieuw gekeken;
+        zonder voortgang groeit de wachttijd met de backoff-factor.
+        """
+        if 0 < percent < 100 and elapsed > 0:
+            eta = (100 - percent) / (percent / elapsed)
+            wait = eta / 2
+        else:
+            wait = interval * self.backoff
+        return max(self.min_interval, min(self.max_interval, wait))
 
-            time.sleep(2)
+    def commit(self) -> None:
+        """
+        Slaat het continuation token van de laatste export op. Pas aanroepen nadat de
+        export volledig is verwerkt, anders gaan responses verloren.
+        """
+        if self._pending_token:
+            self.state.set_state(self.token_key, self._pending_token)
+        self._pending_token = None
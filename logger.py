@@ -1,8 +1,82 @@
+import atexit
+import copy
+import json
 import logging
+import queue
+import re
 import sys
 import os
-from logging.handlers import RotatingFileHandler
-from config import LOG_DIR
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from config import LOG_DIR, LOG_QUEUE, LOG_FORMAT, LOG_RATE_LIMIT_SECONDS
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class _QueueHandler(QueueHandler):
+    """
+    Zet de melding vast (msg % args) maar laat het formatteren, inclusief de
+    traceback, aan de handlers van de listener: zo is de uitvoer gelijk aan die
+    zonder queue (ook het aparte "exception"-veld in JSON).
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Laat meldingen die zelf om rate limiting vragen (extra={"rate_limit": True} of
+    een vaste sleutel, bijv. "visuals_stdout") maar één keer per `interval` seconden
+    door. Bij True is de sleutel de tekst met getallen genegeerd ("Export voortgang: 40%").
+    Het aantal onderdrukte meldingen komt achter de volgende doorgelaten melding.
+    """
+
+    _digits = re.compile(r"\d+")
+
+    def __init__(self, interval: float):
+        super().__init__()
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._last = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate_limit = getattr(record, "rate_limit", None)
+        if not rate_limit or record.levelno >= logging.WARNING:
+            return True
+
+        if rate_limit is True:
+            rate_limit = self._digits.sub("#", record.getMessage())
+        key = (record.name, record.levelno, rate_limit)
+        now = time.monotonic()
+        with self._lock:
+            last, suppressed = self._last.get(key, (None, 0))
+            if last is not None and now - last < self.interval:
+                self._last[key] = (last, suppressed + 1)
+                return False
+            self._last[key] = (now, 0)
+
+        if suppressed:
+            record.msg = f"{record.getMessage()} ({suppressed}x onderdrukt)"
+            record.args = None
+        return True
 
 
 class Logger:
@@ -16,10 +90,13 @@ class Logger:
         if logger.handlers:
             return logger
 
-        formatter = logging.Formatter(
-            "%(asctime)s | %(levelname)s | %(message)s",
-            "%Y-%m-%d %H:%M:%S"
-        )
+        if LOG_FORMAT == "json":
+            formatter = JsonFormatter()
+        else:
+            formatter = logging.Formatter(
+                "%(asctime)s | %(levelname)s | %(message)s",
+                "%Y-%m-%d %H:%M:%S"
+            )
 
         stream_handler = logging.StreamHandler(sys.stdout)
         stream_handler.setFormatter(formatter)
@@ -32,7 +109,21 @@ class Logger:
         )
         file_handler.setFormatter(formatter)
 
-        logger.addHandler(stream_handler)
-        logger.addHandler(file_handler)
+        handlers = [stream_handler, file_handler]
+
+        if LOG_QUEUE:
+            # Alleen een put() op de aanroepende thread; schrijven en roteren gebeurt
+            # in de listener-thread, die bij afsluiten de queue nog leegschrijft
+            log_queue = queue.SimpleQueue()
+            listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+            listener.start()
+            atexit.register(listener.stop)
+            handlers = [_QueueHandler(log_queue)]
+
+        for handler in handlers:
+            logger.addHandler(handler)
+
+        if LOG_RATE_LIMIT_SECONDS > 0:
+            logger.addFilter(RateLimitFilter(LOG_RATE_LIMIT_SECONDS))
 
         return logger
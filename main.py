@@ -1,78 +1,277 @@
-import time
-import sys
-import subprocess
+import io
+import os
+import json
+import importlib
+import threading
+from contextlib import redirect_stdout
 
-from config import POLL_INTERVAL_SECONDS
 from loggers.logger import Logger
 
-from poller.qualtrics_client import QualtricsClient
+from config import SURVEY_IDS, QUALTRICS_MAX_CONCURRENT_REQUESTS
+from poller.qualtrics_client import QualtricsClient, build_session
 from poller.export_service import ExportService
 from poller.csv_handler import CsvHandler
 from poller.database import Database
 from poller.poller import QualtricsPoller
+from poller.async_poller import MultiSurveyPoller
+from poller.scan_worker import ScanWorker
+from poller.scheduler import CycleScheduler
+from poller.control_server import start_control_server
+from poller.metrics import Metrics
 
-VISUALS_SCRIPT_PATH = "/app/CollectieveKracht_VisualsScript.py"
+VISUALS_MODULE = "CollectieveKracht_VisualsScript"
+MAIL_MODULE = "sendgrid"
 
+# Zware modules (pandas/matplotlib) één keer importeren en tussen cycles hergebruiken
+_modules = {}
 
-def run_visuals(logger):
+
+def _load(name: str):
+    if name not in _modules:
+        _modules[name] = importlib.import_module(name)
+    return _modules[name]
+
+
+def _visuals_paths(visuals, survey_id=None) -> tuple:
+    if survey_id is None:
+        return visuals.OUT_DIR, visuals.MANIFEST_PATH
+    out_dir = os.path.join(visuals.OUT_DIR, survey_id)
+    return out_dir, os.path.join(out_dir, "charts_manifest.json")
+
+
+def visuals_pending(logger, database, survey_id=None) -> bool:
     """
-    Draait het visuals script na de poller.
+    True als de PDF's achterlopen op de database: de manifest ontbreekt terwijl er
+    gescande responses zijn, of is ouder dan de laatste scan (bv. na een cycle die
+    halverwege faalde).
     """
     try:
-        result = subprocess.run(
-            [sys.executable, VISUALS_SCRIPT_PATH],
-            capture_output=True,
-            text=True,
-            check=True,
-        )
+        visuals = _load(VISUALS_MODULE)
+        _, manifest_path = _visuals_paths(visuals, survey_id)
+        last_scan = database.last_scanned_at(survey_id)
+        if last_scan is None:
+            return False
+        if not os.path.exists(manifest_path):
+            return True
+        return os.path.getmtime(manifest_path) < last_scan.timestamp()
+    except Exception:
+        logger.exception("Kon de status van de visuals niet bepalen.")
+        return False
+
+
+def run_visuals(logger, database=None, long_df=None, metrics=None, survey_id=None) -> bool:
+    """
+    Draait de visuals-stap in hetzelfde proces na de poller. Met een database worden
+    de counts met één query uit de answers-tabel gehaald. Met survey_id alleen de
+    antwoorden van die survey, met PDF's en manifest in een eigen submap.
+    Geeft False terug als een of meer groepen (of de hele stap) gefaald zijn.
+    """
+    try:
+        visuals = _load(VISUALS_MODULE)
 
-        if result.stdout.strip():
-            logger.info(f"[visuals stdout]\n{result.stdout}")
+        cube = None
+        if database is not None and long_df is None:
+            # Geen rijen = lege cube (nog geen antwoorden); nooit terugvallen op een
+            # long-tabel van schijf, die hoort niet bij deze database/survey
+            rows = database.answer_counts(visuals.GROUP_BY_QID, visuals.ANALYZE_QIDS, survey_id=survey_id)
+            cube = visuals.cube_from_rows(rows)
 
-        if result.stderr.strip():
-            logger.warning(f"[visuals stderr]\n{result.stderr}")
+        out_dir, manifest_path = _visuals_paths(visuals, survey_id)
 
-        logger.info("Visuals-script succesvol afgerond.")
+        stdout = io.StringIO()
+        with redirect_stdout(stdout):
+            results = visuals.main(long_df, cube=cube, out_dir=out_dir, manifest_path=manifest_path)
 
-    except FileNotFoundError:
+        if stdout.getvalue().strip():
+            logger.info(f"[visuals stdout]\n{stdout.getvalue()}", extra={"rate_limit": "visuals_stdout"})
+
+        failed = [r for r in results if r.error]
+        if metrics is not None:
+            metrics.inc("visuals_groups_rendered", sum(1 for r in results if r.pdf_path and not r.unchanged))
+            metrics.inc("visuals_groups_failed", len(failed))
+        if failed:
+            logger.error(f"Visuals: {len(failed)} van {len(results)} groep(en) gefaald.")
+            return False
+        logger.info("Visuals succesvol afgerond.")
+        return True
+
+    except ImportError:
         logger.exception(
-            f"Visuals-script niet gevonden op {VISUALS_SCRIPT_PATH}. "
+            f"Visuals-module {VISUALS_MODULE} niet gevonden. "
             "Controleer of het bestand is meegekopieerd in de Docker image."
         )
-    except subprocess.CalledProcessError as e:
-        logger.error("Visuals-script faalde.")
-        if e.stdout:
-            logger.error(f"[visuals stdout]\n{e.stdout}")
-        if e.stderr:
-            logger.error(f"[visuals stderr]\n{e.stderr}")
     except Exception:
-        logger.exception("Onverwachte fout bij het draaien van het visuals-script.")
+        logger.exception("Onverwachte fout bij het draaien van de visuals.")
+    return False
+
+
+def _mail_kwargs(mail, survey_id=None) -> dict:
+    if survey_id is None:
+        return {"charts_dir": mail.CHARTS_DIR, "ledger_path": mail.LEDGER_PATH}
+    charts_dir = os.path.join(mail.CHARTS_DIR, survey_id)
+    return {
+        "charts_dir": charts_dir,
+        "ledger_path": os.path.join(charts_dir, "mail_ledger.json"),
+        "label": survey_id,
+    }
+
+
+def mail_pending(logger, survey_id=None) -> bool:
+    """
+    True als er PDF's zijn die nog niet (of gewijzigd) verstuurd zijn, bv. omdat SMTP
+    eerder niet bereikbaar was. Alleen hashen van bestanden; goedkoop genoeg voor elke cycle.
+    """
+    try:
+        mail = _load(MAIL_MODULE)
+        if not mail.is_configured():
+            return False
+        kwargs = _mail_kwargs(mail, survey_id)
+        return bool(mail.pending_pdfs(kwargs["charts_dir"], mail.load_ledger(kwargs["ledger_path"])))
+    except Exception:
+        logger.exception("Kon openstaande mail niet bepalen.")
+        return False
+
+
+def run_mail(logger, metrics=None, survey_id=None):
+    """
+    Verstuurt de PDF's in hetzelfde proces. Met survey_id de PDF's uit de submap
+    van die survey, met een eigen ledger.
+    """
+    try:
+        mail = _load(MAIL_MODULE)
+        if not mail.is_configured():
+            logger.warning("Mail overgeslagen: SMTP_PASS, SMTP_FROM of DEMO_EMAIL_TO ontbreekt.")
+            return
+
+        stdout = io.StringIO()
+        with redirect_stdout(stdout):
+            results = mail.send_reports(**_mail_kwargs(mail, survey_id))
+
+        if stdout.getvalue().strip():
+            logger.info(f"[mail stdout]\n{stdout.getvalue()}", extra={"rate_limit": "mail_stdout"})
+
+        failed = [r for r in results if not r.ok]
+        if metrics is not None:
+            metrics.inc("mail_messages_sent", len(results) - len(failed))
+            metrics.inc("mail_messages_failed", len(failed))
+        if failed:
+            logger.error(f"Mail: {len(failed)} van {len(results)} bericht(en) niet verstuurd.")
+
+    except Exception:
+        logger.exception("Onverwachte fout bij het versturen van de mail.")
+
+
+def build_multi_survey_poller(survey_ids, database, logger, scan_worker, metrics):
+    """
+    Eén QualtricsPoller per survey, met een gedeelde session en een globale limiter
+    voor het aantal gelijktijdige Qualtrics-requests.
+    """
+    session = build_session()
+    limiter = threading.BoundedSemaphore(QUALTRICS_MAX_CONCURRENT_REQUESTS)
+
+    pollers = []
+    for survey_id in survey_ids:
+        client = QualtricsClient(logger, session=session, survey_id=survey_id, limiter=limiter)
+        export_service = ExportService(client, logger, state=database, metrics=metrics)
+        csv_handler = CsvHandler(logger, metrics=metrics)
+        pollers.append(
+            QualtricsPoller(export_service, csv_handler, database, logger, metrics=metrics, survey_id=survey_id)
+        )
+    return MultiSurveyPoller(pollers, logger, scan_worker=scan_worker)
 
 
 def main():
     logger = Logger.create_logger("qualtrics_poller")
 
-    client = QualtricsClient(logger)
-    export_service = ExportService(client, logger)
-    csv_handler = CsvHandler(logger)
+    metrics = Metrics()
     database = Database(logger)
+    database.initialize()
+    scan_worker = ScanWorker(database, logger)
 
-    poller = QualtricsPoller(export_service, csv_handler, database, logger)
+    # Visuals en mail per survey; None = de enkele survey (output zoals voorheen)
+    report_surveys = [None]
+    if len(SURVEY_IDS) > 1:
+        poller = build_multi_survey_poller(SURVEY_IDS, database, logger, scan_worker, metrics)
+        report_surveys = list(SURVEY_IDS)
+        logger.info(f"Multi-survey modus: {', '.join(SURVEY_IDS)}")
+    else:
+        client = QualtricsClient(logger)
+        csv_handler = CsvHandler(logger, metrics=metrics)
+        export_service = ExportService(client, logger, state=database, metrics=metrics)
+        poller = QualtricsPoller(
+            export_service, csv_handler, database, logger, scan_worker=scan_worker, metrics=metrics
+        )
+
+    scheduler = CycleScheduler(logger)
+    scheduler.install_signal_handler()
+    start_control_server(scheduler, logger, metrics=metrics)
 
     logger.info("Qualtrics poller gestart")
 
+    first_cycle = True
+    # Surveys waarvan de laatste visuals-run (deels) faalde; die worden ook in een
+    # rustige cycle opnieuw gedraaid
+    visuals_failed = set()
     while True:
+        changed = 0
         try:
-            poller.run_once()
-            run_visuals(logger)
+            with metrics.timer("cycle"):
+                with metrics.timer("poll"):
+                    stats = poller.run_once()
+                metrics.set_gauge("db_records", database.count())
+
+                changed = stats["inserted"] + stats["updated"]
+                scheduler.record(changed)
 
-            subprocess.run([sys.executable, "/app/sendgrid.py"], check=False)
+                for survey_id in report_surveys:
+                    if survey_id is None:
+                        survey_changed = changed
+                    else:
+                        survey_stats = stats["surveys"].get(survey_id, {})
+                        survey_changed = survey_stats.get("inserted", 0) + survey_stats.get("updated", 0)
+
+                    # Zonder DB-wijzigingen zijn visuals overbodig (behalve bij opstart of
+                    # als er nog werk openstaat: gefaalde groepen, ontbrekende/verouderde manifest)
+                    if (
+                        survey_changed
+                        or first_cycle
+                        or survey_id in visuals_failed
+                        or visuals_pending(logger, database, survey_id)
+                    ):
+                        with metrics.timer("visuals"):
+                            ok = run_visuals(logger, database, metrics=metrics, survey_id=survey_id)
+                        if ok:
+                            visuals_failed.discard(survey_id)
+                        else:
+                            visuals_failed.add(survey_id)
+
+                        with metrics.timer("mail"):
+                            run_mail(logger, metrics=metrics, survey_id=survey_id)
+                    elif mail_pending(logger, survey_id):
+                        # Eerder niet verstuurde PDF's (bv. SMTP onbereikbaar) opnieuw proberen
+                        with metrics.timer("mail"):
+                            run_mail(logger, metrics=metrics, survey_id=survey_id)
+                    else:
+                        logger.info(
+                            "Geen nieuwe of gewijzigde responses"
+                            + (f" ({survey_id})" if survey_id else "")
+                            + "; visuals en mail overgeslagen."
+                        )
+
+            first_cycle = False
 
         except Exception:
+            metrics.inc("cycle_errors")
             logger.exception("Onverwachte fout in polling/visuals cycle")
 
-        logger.info(f"Wachten {POLL_INTERVAL_SECONDS} seconden")
-        time.sleep(POLL_INTERVAL_SECONDS)
+        metrics.set_gauge("poll_interval_seconds", scheduler.interval)
+
+        # Eén JSON-regel per cycle: welke stage het poll-interval opeet
+        summary = metrics.cycle_summary()
+        summary.update(changed=changed, next_interval_seconds=scheduler.interval)
+        logger.info("Cycle summary: " + json.dumps(summary, sort_keys=True))
+
+        scheduler.wait()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,99 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator
+
+METRIC_PREFIX = "burgercollectieven"
+
+
+class Metrics:
+    """
+    Lichte timers en counters per stage. Totalen lopen over de hele levensduur
+    (voor /metrics), daarnaast wordt per cycle een samenvatting bijgehouden.
+    """
+
+    def __init__(self, prefix: str = METRIC_PREFIX):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._stages: Dict[str, Dict[str, float]] = {}
+        self._counters: Dict[str, float] = {}
+        self._gauges: Dict[str, float] = {}
+        self._cycle_stages: Dict[str, float] = {}
+        self._cycle_counters: Dict[str, float] = {}
+
+    @contextmanager
+    def timer(self, stage: str) -> Iterator[None]:
+        start = time.perf_counter()
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            self.observe(stage, time.perf_counter() - start, ok)
+
+    def observe(self, stage: str, seconds: float, ok: bool = True) -> None:
+        with self._lock:
+            stats = self._stages.setdefault(
+                stage, {"count": 0, "errors": 0, "total_seconds": 0.0, "last_seconds": 0.0}
+            )
+            stats["count"] += 1
+            stats["errors"] += 0 if ok else 1
+            stats["total_seconds"] += seconds
+            stats["last_seconds"] = seconds
+            self._cycle_stages[stage] = self._cycle_stages.get(stage, 0.0) + seconds
+
+    def inc(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+            self._cycle_counters[name] = self._cycle_counters.get(name, 0) + value
+
+    def set_gauge(self, name: str, value: float) -> None:
+        with self._lock:
+            self._gauges[name] = value
+
+    def cycle_summary(self, reset: bool = True) -> dict:
+        """
+        Seconden per stage en counters sinds de vorige samenvatting.
+        """
+        with self._lock:
+            summary = {
+                "stages": {k: round(v, 4) for k, v in self._cycle_stages.items()},
+                "counters": dict(self._cycle_counters),
+            }
+            if reset:
+                self._cycle_stages.clear()
+                self._cycle_counters.clear()
+        return summary
+
+    def render(self) -> str:
+        """
+        Prometheus text format (version 0.0.4).
+        """
+        p = self.prefix
+        with self._lock:
+            stages = {k: dict(v) for k, v in self._stages.items()}
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+
+        lines = [
+            f"# HELP {p}_stage_seconds Duur per stage van de poll cycle.",
+            f"# TYPE {p}_stage_seconds summary",
+        ]
+        for stage, s in sorted(stages.items()):
+            lines.append(f'{p}_stage_seconds_sum{{stage="{stage}"}} {s["total_seconds"]:.6f}')
+            lines.append(f'{p}_stage_seconds_count{{stage="{stage}"}} {s["count"]}')
+        lines.append(f"# TYPE {p}_stage_errors_total counter")
+        for stage, s in sorted(stages.items()):
+            lines.append(f'{p}_stage_errors_total{{stage="{stage}"}} {s["errors"]}')
+        lines.append(f"# TYPE {p}_stage_last_seconds gauge")
+        for stage, s in sorted(stages.items()):
+            lines.append(f'{p}_stage_last_seconds{{stage="{stage}"}} {s["last_seconds"]:.6f}')
+
+        for name, value in sorted(counters.items()):
+            lines.append(f"# TYPE {p}_{name}_total counter")
+            lines.append(f"{p}_{name}_total {value:g}")
+        for name, value in sorted(gauges.items()):
+            lines.append(f"# TYPE {p}_{name} gauge")
+            lines.append(f"{p}_{name} {value:g}")
+
+        return "\n".join(lines) + "\n"
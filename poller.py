@@ -1,22 +1,50 @@
+from config import SURVEY_ID
+from poller.database import iter_response_rows
+from poller.metrics import Metrics
+
+
 class QualtricsPoller:
-    def __init__(self, export_service, csv_handler, database, logger):
+    def __init__(
+        self, export_service, csv_handler, database, logger, scan_worker=None, metrics=None, survey_id=None
+    ):
         self.export_service = export_service
         self.csv_handler = csv_handler
         self.database = database
         self.logger = logger
+        # Optioneel: vult de answers-tabel direct na de ingest
+        self.scan_worker = scan_worker
+        self.metrics = metrics or Metrics()
+        self.survey_id = survey_id or SURVEY_ID
+
+    def _iter_rows(self, export):
+        for batch in self.csv_handler.iter_batches(export):
+            yield from iter_response_rows(batch)
+
+    def run_once(self) -> dict:
+        self.logger.info(f"Polling cycle gestart ({self.survey_id})")
 
-    def run_once(self):
-        self.logger.info("Polling cycle gestart")
+        export = self.export_service.run_export()
 
-        zip_bytes = self.export_service.run_export()
-        df = self.csv_handler.extract_dataframe(zip_bytes)
+        try:
+            # Batches stromen direct door naar één DB-transactie; de "upsert"-tijd
+            # omvat daardoor ook het parsen (apart gemeten als "parse")
+            with self.metrics.timer("upsert"):
+                stats = self.database.upsert_many(self._iter_rows(export), survey_id=self.survey_id)
+        finally:
+            export.close()
+        self.export_service.commit()
 
-        before = self.database.count()
+        for key in ("inserted", "updated", "unchanged"):
+            self.metrics.inc(f"responses_{key}", stats[key])
+        self.metrics.inc("db_bytes_written", stats["bytes_written"])
 
-        for _, row in df.iterrows():
-            response_id = str(row.get("ResponseId"))
-            if response_id.startswith("R_"):
-                self.database.upsert(response_id, row.to_json())
+        self.logger.info(
+            f"DB records ({self.survey_id}): {self.database.count(self.survey_id)} "
+            f"(inserted {stats['inserted']}, updated {stats['updated']}, "
+            f"unchanged {stats['unchanged']}; {stats['bytes_written'] / 1024:.1f} KiB geschreven)"
+        )
 
-        after = self.database.count()
-        self.logger.info(f"DB records: {after} (Δ {after - before})")
+        if self.scan_worker is not None:
+            with self.metrics.timer("scan"):
+                stats["scan"] = self.scan_worker.run_once()
+        return stats
@@ -1,20 +1,68 @@
+import tempfile
+import threading
+import time
+from contextlib import nullcontext
+from typing import BinaryIO, Dict, Optional
+
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from config import (
     QUALTRICS_API_TOKEN,
     QUALTRICS_DATACENTER,
     SURVEY_ID,
     TIMEOUT_EXPORT_START,
     TIMEOUT_STATUS_CHECK,
-    TIMEOUT_FILE_DOWNLOAD
+    TIMEOUT_FILE_DOWNLOAD,
+    DOWNLOAD_CHUNK_SIZE,
+    DOWNLOAD_SPOOL_MAX_BYTES,
+    DOWNLOAD_MAX_RESUMES,
+    HTTP_RETRY_TOTAL,
+    HTTP_RETRY_BACKOFF,
+    HTTP_RETRY_STATUSES,
+    HTTP_POOL_SIZE
 )
 
 
+def build_session(pool_size: int = HTTP_POOL_SIZE) -> requests.Session:
+    """
+    requests.Session met keep-alive pool en retry/backoff op 429/5xx.
+    Retry-After van Qualtrics wordt gerespecteerd.
+    """
+    retry = Retry(
+        total=HTTP_RETRY_TOTAL,
+        backoff_factor=HTTP_RETRY_BACKOFF,
+        status_forcelist=HTTP_RETRY_STATUSES,
+        allowed_methods=frozenset({"GET", "POST"}),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
 class QualtricsClient:
-    def __init__(self, logger):
+    def __init__(
+        self,
+        logger,
+        session: Optional[requests.Session] = None,
+        survey_id: Optional[str] = None,
+        limiter: Optional[threading.Semaphore] = None,
+    ):
         self.logger = logger
+        # Meerdere clients kunnen één session (pool) en één limiter delen
+        self.session = session or build_session()
+        self.limiter = limiter
+        self.latency: Dict[str, Dict[str, float]] = {}
+        self._latency_lock = threading.Lock()
+        self.survey_id = survey_id or SURVEY_ID
         self.base_url = (
             f"https://{QUALTRICS_DATACENTER}.qualtrics.com/API/v3/"
-            f"surveys/{SURVEY_ID}/export-responses/"
+            f"surveys/{self.survey_id}/export-responses/"
         )
         self.headers = {
             "X-API-TOKEN": QUALTRICS_API_TOKEN,
@@ -22,30 +70,145 @@ class QualtricsClient:
             "Accept": "application/octet-stream"
         }
 
-    def start_export(self) -> str:
-        response = requests.post(
+    def _request(
+        self, endpoint: str, method: str, url: str, extra_headers: Optional[dict] = None, **kwargs
+    ) -> requests.Response:
+        """
+        Voert een request uit via de gedeelde session en registreert de latency per endpoint
+        (bij stream=True: tijd tot de response headers). Met een limiter telt het request
+        mee voor het globale maximum aan gelijktijdige requests.
+        """
+        start = time.perf_counter()
+        ok = False
+        try:
+            headers = {**self.headers, **(extra_headers or {})}
+            with self.limiter or nullcontext():
+                response = self.session.request(method, url, headers=headers, **kwargs)
+            ok = response.ok
+            return response
+        finally:
+            self._record_latency(endpoint, time.perf_counter() - start, ok)
+
+    def _record_latency(self, endpoint: str, seconds: float, ok: bool) -> None:
+        with self._latency_lock:
+            stats = self.latency.setdefault(
+                endpoint, {"count": 0, "errors": 0, "total_seconds": 0.0, "max_seconds": 0.0}
+            )
+            stats["count"] += 1
+            stats["errors"] += 0 if ok else 1
+            stats["total_seconds"] += seconds
+            stats["max_seconds"] = max(stats["max_seconds"], seconds)
+
+    def latency_stats(self) -> Dict[str, Dict[str, float]]:
+        with self._latency_lock:
+            return {endpoint: dict(stats) for endpoint, stats in self.latency.items()}
+
+    def close(self) -> None:
+        self.session.close()
+
+    def start_export(self, continuation_token: Optional[str] = None, incremental: bool = False) -> str:
+        """
+        Start een export. Met incremental=True vraagt Qualtrics een continuation token aan
+        (terug te vinden in check_status); met een continuation_token worden alleen
+        responses sinds de vorige export geleverd.
+        """
+        payload = {"format": "csv"}
+        if continuation_token:
+            payload["continuationToken"] = continuation_token
+        elif incremental:
+            payload["allowContinuation"] = True
+
+        response = self._request(
+            "start_export",
+            "POST",
             self.base_url,
-            headers=self.headers,
-            json={"format": "csv"},
+            json=payload,
             timeout=TIMEOUT_EXPORT_START
         )
         response.raise_for_status()
         return response.json()["result"]["progressId"]
 
     def check_status(self, progress_id: str) -> dict:
-        response = requests.get(
+        response = self._request(
+            "check_status",
+            "GET",
             f"{self.base_url}{progress_id}",
-            headers=self.headers,
             timeout=TIMEOUT_STATUS_CHECK
         )
         response.raise_for_status()
         return response.json()["result"]
 
-    def download_file(self, file_id: str) -> bytes:
-        response = requests.get(
-            f"{self.base_url}{file_id}/file",
-            headers=self.headers,
-            timeout=TIMEOUT_FILE_DOWNLOAD
-        )
-        response.raise_for_status()
-        return response.content
+    def download_file(self, file_id: str) -> BinaryIO:
+        """
+        Streamt de export naar een SpooledTemporaryFile (in geheugen tot
+        DOWNLOAD_SPOOL_MAX_BYTES, daarboven op schijf). Bij een verbroken verbinding
+        wordt met een HTTP Range-request hervat. Geeft het bestand terug op positie 0.
+        """
+        url = f"{self.base_url}{file_id}/file"
+        out = tempfile.SpooledTemporaryFile(max_size=DOWNLOAD_SPOOL_MAX_BYTES)
+        expected: Optional[int] = None
+        resumes = 0
+
+        try:
+            while True:
+                offset = out.tell()
+                headers = {"Range": f"bytes={offset}-"} if offset else {}
+
+                try:
+                    with self._request(
+                        "download_file",
+                        "GET",
+                        url,
+                        extra_headers=headers,
+                        stream=True,
+                        # (connect, read): de read-timeout geldt per chunk, niet voor de hele download
+                        timeout=(TIMEOUT_EXPORT_START, TIMEOUT_FILE_DOWNLOAD)
+                    ) as response:
+                        response.raise_for_status()
+
+                        if offset and response.status_code != 206:
+                            # Server negeert Range: opnieuw vanaf het begin
+                            self.logger.warning("Server ondersteunt geen Range; download opnieuw gestart")
+                            out.seek(0)
+                            out.truncate()
+                            offset = 0
+
+                        if expected is None:
+                            expected = self._expected_size(response, offset)
+
+                        for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                            out.write(chunk)
+                    break
+
+                except (requests.ConnectionError, requests.exceptions.ChunkedEncodingError) as e:
+                    resumes += 1
+                    if resumes > DOWNLOAD_MAX_RESUMES:
+                        raise
+                    self.logger.warning(
+                        f"Download onderbroken na {out.tell()} bytes ({e}); hervatten ({resumes}/{DOWNLOAD_MAX_RESUMES})"
+                    )
+
+            size = out.tell()
+            if expected is not None and size != expected:
+                raise IOError(f"Download onvolledig: {size} van {expected} bytes ontvangen")
+
+            self.logger.info(f"Export gedownload: {size} bytes")
+            out.seek(0)
+            return out
+
+        except Exception:
+            out.close()
+            raise
+
+    @staticmethod
+    def _expected_size(response: requests.Response, offset: int) -> Optional[int]:
+        # Bij gecomprimeerde transfer zegt Content-Length niets over de gedecodeerde grootte
+        if response.headers.get("Content-Encoding"):
+            return None
+
+        content_range = response.headers.get("Content-Range", "")
+        if "/" in content_range and not content_range.endswith("/*"):
+            return int(content_range.rsplit("/", 1)[1])
+
+        length = response.headers.get("Content-Length")
+        return offset + int(length) if length is not None else None
@@ -0,0 +1,78 @@
+import io
+import json
+from contextlib import redirect_stdout
+from datetime import datetime, timezone
+from typing import Dict, List, Tuple
+
+import pandas as pd
+
+from config import SCAN_BATCH_SIZE
+from CollectieveKracht_ZelfscanScript_V2 import data_avg_proof, data_unpivot
+
+
+class ScanWorker:
+    """
+    Verwerkt NEW-responses uit de database in batches: AVG-proof en unpivot alleen
+    op die rijen, en schrijft de long-format antwoorden naar de answers-tabel.
+    """
+
+    def __init__(self, database, logger, batch_size: int = SCAN_BATCH_SIZE):
+        self.database = database
+        self.logger = logger
+        self.batch_size = batch_size
+
+    def run_once(self) -> Dict[str, int]:
+        stats = {"done": 0, "error": 0}
+        # Elke rij krijgt in store_scan_results een scanned_at; ERROR-rijen van deze
+        # run (opnieuw of voor het eerst gefaald) komen daardoor niet nog eens terug
+        run_started = datetime.now(timezone.utc).isoformat()
+
+        while True:
+            rows = self.database.fetch_unscanned(self.batch_size, retried_before=run_started)
+            if not rows:
+                break
+
+            answers, done_ids, errors = self._process_batch(rows)
+            self.database.store_scan_results(answers, done_ids, errors)
+
+            stats["done"] += len(done_ids)
+            stats["error"] += len(errors)
+
+        if stats["done"] or stats["error"]:
+            self.logger.info(f"Scan: {stats['done']} responses verwerkt, {stats['error']} met fout")
+        return stats
+
+    def _process_batch(self, rows: List[Tuple[str, str]]):
+        try:
+            return self._transform(rows), [rid for rid, _ in rows], {}
+        except Exception:
+            self.logger.warning(f"Scan-batch van {len(rows)} rijen faalde; per rij opnieuw")
+
+        # Per rij isoleren welke responses de fout veroorzaken
+        answers, done_ids, errors = [], [], {}
+        for rid, data in rows:
+            try:
+                answers.extend(self._transform([(rid, data)]))
+                done_ids.append(rid)
+            except Exception as e:
+                errors[rid] = f"{type(e).__name__}: {e}"
+        return answers, done_ids, errors
+
+    @staticmethod
+    def _transform(rows: List[Tuple[str, str]]) -> List[Tuple[str, str, str]]:
+        df = pd.DataFrame.from_records([json.loads(data) for _, data in rows])
+
+        # De Zelfscan-stappen printen voortgang; in de worker niet nodig
+        with redirect_stdout(io.StringIO()):
+            long_df = data_unpivot(data_avg_proof(df))
+
+        long_df = long_df.dropna(subset=["Answer"])
+        answer = long_df["Answer"].astype(str).str.strip()
+        keep = answer != ""
+        return list(
+            zip(
+                long_df["ResponsID"].astype(str).str.strip()[keep],
+                long_df["QuestionID"].astype(str).str.strip()[keep],
+                answer[keep],
+            )
+        )
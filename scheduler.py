@@ -0,0 +1,57 @@
+import signal
+import threading
+
+from config import (
+    POLL_INTERVAL_SECONDS,
+    POLL_INTERVAL_MIN_SECONDS,
+    POLL_INTERVAL_MAX_SECONDS,
+    POLL_BACKOFF,
+)
+
+
+class CycleScheduler:
+    """
+    Bepaalt wanneer de volgende cycle draait. Bij nieuwe responses wordt het
+    interval teruggezet naar het minimum, bij een stille survey groeit het met
+    POLL_BACKOFF tot het maximum. trigger() (SIGUSR1 of HTTP) start direct een cycle.
+    """
+
+    def __init__(
+        self,
+        logger,
+        interval: float = POLL_INTERVAL_SECONDS,
+        min_interval: float = POLL_INTERVAL_MIN_SECONDS,
+        max_interval: float = POLL_INTERVAL_MAX_SECONDS,
+        backoff: float = POLL_BACKOFF,
+    ):
+        self.logger = logger
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.interval = max(min_interval, min(max_interval, interval))
+        self._wake = threading.Event()
+        self._reason = None
+
+    def install_signal_handler(self, signum: int = signal.SIGUSR1) -> None:
+        signal.signal(signum, lambda *_: self.trigger("signaal"))
+
+    def trigger(self, reason: str = "extern") -> None:
+        self._reason = reason
+        self._wake.set()
+
+    def record(self, changed: int) -> None:
+        if changed > 0:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.max_interval, self.interval * self.backoff)
+
+    def wait(self) -> bool:
+        """
+        Wacht tot het volgende interval of een trigger. Geeft True terug bij een trigger.
+        """
+        self.logger.info(f"Wachten {self.interval:.0f} seconden")
+        triggered = self._wake.wait(self.interval)
+        self._wake.clear()
+        if triggered:
+            self.logger.info(f"Cycle direct gestart ({self._reason})")
+        return triggered
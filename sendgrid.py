@@ -1,7 +1,12 @@
 import os
 import glob
+import json
 import ssl
+import time
+import hashlib
 import smtplib
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
 from email.message import EmailMessage
 
 SMTP_HOST = os.getenv("SMTP_HOST", "smtp.sendgrid.net")
@@ -10,26 +15,102 @@ SMTP_USER = os.getenv("SMTP_USER", "apikey")
 SMTP_PASS = os.getenv("SMTP_PASS")                    
 MAIL_FROM = os.getenv("SMTP_FROM")                    
 MAIL_TO = os.getenv("DEMO_EMAIL_TO")                  
+# Voor een lokale test-SMTP (bijv. aiosmtpd): SMTP_STARTTLS=0 en SMTP_AUTH=0
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "1") == "1"
+SMTP_AUTH = os.getenv("SMTP_AUTH", "1") == "1"
 
 CHARTS_DIR = os.getenv("CHARTS_DIR", "/app/data/charts")
 
+# Content-hash per verstuurde PDF; alleen nieuwe of gewijzigde PDF's worden verstuurd
+LEDGER_PATH = os.getenv("MAIL_LEDGER_PATH", "/app/data/mail_ledger.json")
+# Max. totale bijlagegrootte per e-mail (na base64); grotere sets worden gesplitst
+MAX_MESSAGE_BYTES = int(os.getenv("MAIL_MAX_MESSAGE_BYTES", str(20 * 1024 * 1024)))
+SEND_RETRIES = int(os.getenv("MAIL_SEND_RETRIES", "3"))
+RETRY_BACKOFF_SECONDS = 2.0
 
-def main():
-    if not (SMTP_PASS and MAIL_FROM and MAIL_TO):
-        raise SystemExit("Missing env vars: SMTP_PASS, SMTP_FROM, DEMO_EMAIL_TO")
 
-    pdf_paths = sorted(glob.glob(f"{CHARTS_DIR}/*.pdf"))
-    if not pdf_paths:
-        print(f"No PDFs found in {CHARTS_DIR}")
-        return
+@dataclass
+class SendResult:
+    filenames: list[str]
+    ok: bool = False
+    attempts: int = 0
+    error: str | None = None
+    sent_at: str | None = None
+    size: int = 0
+    hashes: dict[str, str] = field(default_factory=dict, repr=False)
+
+
+def is_configured() -> bool:
+    return bool((SMTP_PASS or not SMTP_AUTH) and MAIL_FROM and MAIL_TO)
+
+
+def file_hash(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def load_ledger(path: str = LEDGER_PATH) -> dict:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
 
+def save_ledger(ledger: dict, path: str = LEDGER_PATH) -> None:
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(ledger, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def pending_pdfs(charts_dir: str, ledger: dict) -> list[tuple[str, str]]:
+    """
+    PDF's waarvan de inhoud nog niet (of anders) verstuurd is: [(pad, hash)].
+    """
+    pending = []
+    for p in sorted(glob.glob(f"{charts_dir}/*.pdf")):
+        digest = file_hash(p)
+        if ledger.get(os.path.basename(p), {}).get("hash") != digest:
+            pending.append((p, digest))
+    return pending
+
+
+def split_batches(files: list[tuple[str, str]], max_bytes: int = MAX_MESSAGE_BYTES) -> list[list[tuple[str, str]]]:
+    """
+    Verdeelt bijlagen over berichten zodat elk bericht (base64 ≈ 4/3) onder max_bytes blijft.
+    Een enkele te grote PDF gaat alleen in een eigen bericht.
+    """
+    batches, current, current_size = [], [], 0
+    for p, digest in files:
+        size = os.path.getsize(p) * 4 // 3
+        if current and current_size + size > max_bytes:
+            batches.append(current)
+            current, current_size = [], 0
+        current.append((p, digest))
+        current_size += size
+    if current:
+        batches.append(current)
+    return batches
+
+
+def build_message(
+    batch: list[tuple[str, str]], mail_to: str, part: int, total: int, label: str | None = None
+) -> EmailMessage:
     msg = EmailMessage()
-    msg["Subject"] = "Demo – PDF charts"
+    msg["Subject"] = (
+        "Demo – PDF charts"
+        + (f" – {label}" if label else "")
+        + (f" ({part}/{total})" if total > 1 else "")
+    )
     msg["From"] = MAIL_FROM
-    msg["To"] = MAIL_TO
+    msg["To"] = mail_to
     msg.set_content("Bijgevoegd: gegenereerde PDF charts (demo).")
 
-    for p in pdf_paths:
+    for p, _ in batch:
         with open(p, "rb") as f:
             msg.add_attachment(
                 f.read(),
@@ -37,16 +118,122 @@ def main():
                 subtype="pdf",
                 filename=os.path.basename(p),
             )
+    return msg
+
+
+class SmtpSession:
+    """
+    Eén SMTP-verbinding voor alle berichten van een run; bij een verbroken
+    verbinding wordt opnieuw verbonden.
+    """
+
+    def __init__(self, host: str | None = None, port: int | None = None):
+        self.host = host or SMTP_HOST
+        self.port = port or SMTP_PORT
+        self._smtp: smtplib.SMTP | None = None
+
+    def _connect(self) -> smtplib.SMTP:
+        smtp = smtplib.SMTP(self.host, self.port, timeout=30)
+        if SMTP_STARTTLS:
+            smtp.starttls(context=ssl.create_default_context())
+        if SMTP_AUTH:
+            smtp.login(SMTP_USER, SMTP_PASS)
+        return smtp
+
+    def send(self, msg: EmailMessage) -> None:
+        if self._smtp is None:
+            self._smtp = self._connect()
+        try:
+            self._smtp.send_message(msg)
+        except (smtplib.SMTPServerDisconnected, OSError):
+            self.close()
+            raise
+
+    def close(self) -> None:
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._smtp = None
+
+
+def send_with_retry(session: SmtpSession, msg: EmailMessage, result: SendResult, retries: int = SEND_RETRIES) -> None:
+    for attempt in range(1, retries + 1):
+        result.attempts = attempt
+        try:
+            session.send(msg)
+            result.ok = True
+            result.error = None
+            result.sent_at = datetime.now(timezone.utc).isoformat()
+            return
+        except (smtplib.SMTPException, OSError) as e:
+            result.error = f"{type(e).__name__}: {e}"
+            # Permanente fouten (5xx) niet opnieuw proberen
+            if isinstance(e, smtplib.SMTPResponseException) and e.smtp_code >= 500:
+                return
+            if attempt < retries:
+                time.sleep(RETRY_BACKOFF_SECONDS * attempt)
+
+
+def send_reports(
+    charts_dir: str = CHARTS_DIR,
+    mail_to: str | None = None,
+    ledger_path: str = LEDGER_PATH,
+    max_bytes: int = MAX_MESSAGE_BYTES,
+    label: str | None = None,
+) -> list[SendResult]:
+    """
+    Verstuurt nieuwe of gewijzigde PDF's uit charts_dir, verdeeld over berichten
+    onder max_bytes, via één SMTP-verbinding. Geeft per bericht een SendResult terug;
+    de ledger wordt per geslaagd bericht bijgewerkt. label (bv. de survey) komt in
+    het onderwerp.
+    """
+    mail_to = mail_to or MAIL_TO
+    if not (MAIL_FROM and mail_to):
+        raise ValueError("Missing env vars: SMTP_FROM, DEMO_EMAIL_TO")
+
+    ledger = load_ledger(ledger_path)
+    pending = pending_pdfs(charts_dir, ledger)
+    if not pending:
+        print(f"No new or changed PDFs in {charts_dir}")
+        return []
+
+    batches = split_batches(pending, max_bytes)
+    results = []
+    session = SmtpSession()
+    try:
+        for i, batch in enumerate(batches, start=1):
+            result = SendResult(
+                filenames=[os.path.basename(p) for p, _ in batch],
+                size=sum(os.path.getsize(p) for p, _ in batch),
+                hashes={os.path.basename(p): digest for p, digest in batch},
+            )
+            send_with_retry(session, build_message(batch, mail_to, i, len(batches), label), result)
+            results.append(result)
+
+            if result.ok:
+                for name, digest in result.hashes.items():
+                    ledger[name] = {"hash": digest, "sent_at": result.sent_at}
+                save_ledger(ledger, ledger_path)
+    finally:
+        session.close()
 
-    ctx = ssl.create_default_context()
-    with smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=30) as s:
-        s.starttls(context=ctx)
-        s.login(SMTP_USER, SMTP_PASS)
-        s.send_message(msg)
+    for r in results:
+        status = "OK" if r.ok else f"FOUT ({r.error})"
+        print(f"Mail to {mail_to}: {len(r.filenames)} PDFs, {r.size} bytes, {r.attempts} poging(en): {status}")
 
-    print(f"Sent 1 email to {MAIL_TO} with {len(pdf_paths)} PDFs from {CHARTS_DIR}")
+    return results
+
+
+def main():
+    try:
+        results = send_reports()
+    except ValueError as e:
+        raise SystemExit(str(e))
+    if any(not r.ok for r in results):
+        raise SystemExit(1)
 
 
 if __name__ == "__main__":
     main()
-
@@ -0,0 +1,153 @@
+"""
+Stub van de Qualtrics export-API (start export, status, download) op localhost.
+"""
+import io
+import json
+import logging
+import threading
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from poller.qualtrics_client import QualtricsClient
+
+SURVEY = "SV_test"
+
+
+def make_export(rows) -> bytes:
+    """
+    Export-ZIP in Qualtrics-vorm: kolomnamen, vraagtekst-rij, ImportId-rij, data.
+    """
+    lines = [
+        "ResponseId,Q1,Q19",
+        "Response ID,Vraag 1,Groep",
+        '"{""ImportId"":""_recordId""}","{""ImportId"":""QID1""}","{""ImportId"":""QID19""}"',
+    ]
+    lines += [",".join(row) for row in rows]
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as z:
+        z.writestr("Survey.csv", "\n".join(lines) + "\n")
+    return buf.getvalue()
+
+
+class StubQualtrics:
+    """
+    Houdt de responses en alle ontvangen requests bij. Een continuation token is de
+    index van de eerste nieuwe response; "expired" geeft een 400 zoals Qualtrics bij
+    een verlopen token. `fail` bevat per endpoint een lijst (status, headers) die
+    eerst worden teruggegeven.
+    """
+
+    def __init__(self):
+        self.responses = []
+        self.requests = []
+        self.exports = {}
+        self.fail = {"start_export": [], "check_status": [], "download_file": []}
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self.server.stub = self
+        self.base_url = (
+            f"http://127.0.0.1:{self.server.server_address[1]}/API/v3/surveys/{SURVEY}/export-responses/"
+        )
+
+    def add_responses(self, *rows) -> None:
+        self.responses.extend(rows)
+
+    def start_payloads(self) -> list:
+        return [payload for endpoint, payload in self.requests if endpoint == "start_export"]
+
+    def count(self, endpoint: str) -> int:
+        return sum(1 for e, _ in self.requests if e == endpoint)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status: int, body: bytes = b"", headers=None, content_type="application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _json(self, obj, status: int = 200):
+        self._send(status, json.dumps(obj).encode())
+
+    def _fail(self, endpoint: str) -> bool:
+        stub = self.server.stub
+        with stub._lock:
+            if not stub.fail[endpoint]:
+                return False
+            status, headers = stub.fail[endpoint].pop(0)
+        self._send(status, headers=headers)
+        return True
+
+    def do_POST(self):
+        stub = self.server.stub
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        stub.requests.append(("start_export", payload))
+        if self._fail("start_export"):
+            return
+
+        token = payload.get("continuationToken")
+        if token == "expired":
+            return self._json({"meta": {"httpStatus": "400 - Bad Request"}}, 400)
+
+        progress_id = f"ES_{len(stub.exports)}"
+        stub.exports[progress_id] = {
+            "start": int(token) if token else 0,
+            "continuation": bool(payload.get("allowContinuation") or token),
+        }
+        self._json({"result": {"progressId": progress_id}})
+
+    def do_GET(self):
+        stub = self.server.stub
+        parts = self.path.rstrip("/").split("/")
+
+        if parts[-1] == "file":
+            stub.requests.append(("download_file", parts[-2]))
+            if self._fail("download_file"):
+                return
+            export = stub.exports[parts[-2].replace("F_", "ES_")]
+            data = make_export(stub.responses[export["start"]:])
+            return self._send(200, data, content_type="application/octet-stream")
+
+        stub.requests.append(("check_status", parts[-1]))
+        if self._fail("check_status"):
+            return
+        progress_id = parts[-1]
+        export = stub.exports[progress_id]
+        result = {"percentComplete": 100, "status": "complete", "fileId": progress_id.replace("ES_", "F_")}
+        if export["continuation"]:
+            result["continuationToken"] = str(len(stub.responses))
+        self._json({"result": result})
+
+
+@pytest.fixture
+def logger():
+    logger = logging.getLogger("tests")
+    logger.setLevel(logging.DEBUG)
+    return logger
+
+
+@pytest.fixture
+def stub():
+    stub = StubQualtrics()
+    thread = threading.Thread(target=stub.server.serve_forever, daemon=True)
+    thread.start()
+    yield stub
+    stub.server.shutdown()
+    stub.server.server_close()
+
+
+@pytest.fixture
+def client(stub, logger):
+    client = QualtricsClient(logger, survey_id=SURVEY)
+    client.base_url = stub.base_url
+    yield client
+    client.close()
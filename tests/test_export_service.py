@@ -0,0 +1,80 @@
+import pytest
+
+from poller.csv_handler import CsvHandler
+from poller.database import Database
+from poller.export_service import ExportService
+from poller.poller import QualtricsPoller
+
+
+@pytest.fixture
+def database(tmp_path, logger):
+    db = Database(logger, path=str(tmp_path / "test.db"))
+    db.initialize()
+    yield db
+    db.close()
+
+
+def make_poller(client, database, logger):
+    export_service = ExportService(client, logger, state=database, incremental=True)
+    return QualtricsPoller(export_service, CsvHandler(logger), database, logger, survey_id=client.survey_id)
+
+
+def test_continuation_token_flow(stub, client, database, logger):
+    poller = make_poller(client, database, logger)
+    token_key = poller.export_service.token_key
+
+    # Eerste export: volledig, met allowContinuation
+    stub.add_responses(("R_1", "a", "Groep 1"), ("R_2", "b", "Groep 2"))
+    stats = poller.run_once()
+    assert stats["inserted"] == 2
+    assert stub.start_payloads()[0] == {"format": "csv", "allowContinuation": True}
+    assert database.get_state(token_key) == "2"
+
+    # Tweede export: alleen nieuwe responses via het opgeslagen token
+    stub.add_responses(("R_3", "c", "Groep 1"))
+    stats = poller.run_once()
+    assert stub.start_payloads()[1] == {"format": "csv", "continuationToken": "2"}
+    assert stats["inserted"] == 1
+    assert database.count() == 3
+    assert database.get_state(token_key) == "3"
+
+
+def test_expired_token_falls_back_to_full_export(stub, client, database, logger):
+    poller = make_poller(client, database, logger)
+    token_key = poller.export_service.token_key
+    database.set_state(token_key, "expired")
+
+    stub.add_responses(("R_1", "a", "Groep 1"), ("R_2", "b", "Groep 2"))
+    stats = poller.run_once()
+
+    payloads = stub.start_payloads()
+    assert payloads == [
+        {"format": "csv", "continuationToken": "expired"},
+        {"format": "csv", "allowContinuation": True},
+    ]
+    assert stats["inserted"] == 2
+    assert database.get_state(token_key) == "2"
+
+
+def test_token_committed_only_after_ingest(stub, client, database, logger, monkeypatch):
+    poller = make_poller(client, database, logger)
+    token_key = poller.export_service.token_key
+    database.set_state(token_key, "0")
+    stub.add_responses(("R_1", "a", "Groep 1"))
+
+    def failing_upsert(rows, **kwargs):
+        list(rows)
+        raise RuntimeError("schijf vol")
+
+    monkeypatch.setattr(database, "upsert_many", failing_upsert)
+    with pytest.raises(RuntimeError):
+        poller.run_once()
+    # De export is gedownload maar niet verwerkt: het oude token blijft staan
+    assert stub.count("download_file") == 1
+    assert database.get_state(token_key) == "0"
+
+    monkeypatch.undo()
+    poller.run_once()
+    assert stub.start_payloads()[-1] == {"format": "csv", "continuationToken": "0"}
+    assert database.count() == 1
+    assert database.get_state(token_key) == "1"
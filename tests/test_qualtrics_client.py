@@ -0,0 +1,66 @@
+import time
+
+import pytest
+import requests
+
+from config import HTTP_RETRY_TOTAL
+from poller import qualtrics_client
+
+
+@pytest.fixture
+def no_backoff(client, monkeypatch):
+    # Zonder backoff tussen retries, anders duren de tests seconden per retry
+    monkeypatch.setattr(qualtrics_client, "HTTP_RETRY_BACKOFF", 0)
+    client.session.close()
+    client.session = qualtrics_client.build_session()
+
+
+def test_retries_on_503_and_429(stub, client, no_backoff):
+    stub.fail["start_export"] = [(503, {}), (429, {})]
+
+    assert client.start_export() == "ES_0"
+    # Twee keer opnieuw geprobeerd, maar voor de client één geslaagde call
+    assert stub.count("start_export") == 3
+    assert client.latency_stats()["start_export"]["count"] == 1
+    assert client.latency_stats()["start_export"]["errors"] == 0
+
+
+def test_respects_retry_after(stub, client):
+    client.start_export()
+    stub.fail["check_status"] = [(503, {"Retry-After": "1"})]
+
+    start = time.perf_counter()
+    status = client.check_status("ES_0")
+    elapsed = time.perf_counter() - start
+
+    assert status["percentComplete"] == 100
+    assert stub.count("check_status") == 2
+    assert elapsed >= 1
+
+
+def test_gives_up_after_retry_total(stub, client, no_backoff):
+    stub.fail["start_export"] = [(500, {})] * (HTTP_RETRY_TOTAL + 1)
+
+    with pytest.raises(requests.HTTPError):
+        client.start_export()
+    assert stub.count("start_export") == HTTP_RETRY_TOTAL + 1
+    assert client.latency_stats()["start_export"]["count"] == 1
+    assert client.latency_stats()["start_export"]["errors"] == 1
+
+
+def test_latency_stats_per_endpoint(stub, client):
+    stub.add_responses(("R_1", "a", "Groep 1"))
+
+    progress_id = client.start_export(incremental=True)
+    client.check_status(progress_id)
+    client.check_status(progress_id)
+    client.download_file(client.check_status(progress_id)["fileId"]).close()
+
+    stats = client.latency_stats()
+    assert {endpoint: s["count"] for endpoint, s in stats.items()} == {
+        "start_export": 1,
+        "check_status": 3,
+        "download_file": 1,
+    }
+    assert all(s["errors"] == 0 for s in stats.values())
+    assert all(0 < s["max_seconds"] <= s["total_seconds"] for s in stats.values())
@@ -0,0 +1,86 @@
+import email
+import email.policy
+import os
+import socket
+
+import pytest
+
+import sendgrid
+
+controller = pytest.importorskip("aiosmtpd.controller")
+
+
+class _Inbox:
+    def __init__(self):
+        self.messages = []
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append(email.message_from_bytes(envelope.content, policy=email.policy.default))
+        return "250 OK"
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def inbox(monkeypatch):
+    """
+    Lokale aiosmtpd-server zonder STARTTLS en login, zoals met SMTP_STARTTLS=0 SMTP_AUTH=0.
+    """
+    inbox = _Inbox()
+    server = controller.Controller(inbox, hostname="127.0.0.1", port=_free_port())
+    server.start()
+    monkeypatch.setattr(sendgrid, "SMTP_HOST", server.hostname)
+    monkeypatch.setattr(sendgrid, "SMTP_PORT", server.port)
+    monkeypatch.setattr(sendgrid, "SMTP_STARTTLS", False)
+    monkeypatch.setattr(sendgrid, "SMTP_AUTH", False)
+    monkeypatch.setattr(sendgrid, "MAIL_FROM", "poller@example.nl")
+    yield inbox
+    server.stop()
+
+
+def write_pdf(path, size: int) -> None:
+    with open(path, "wb") as f:
+        f.write(b"%PDF-1.7\n" + os.urandom(size))
+
+
+def attachments(msg) -> list:
+    return sorted(part.get_filename() for part in msg.iter_attachments())
+
+
+def test_send_reports_splits_skips_and_resends(inbox, tmp_path):
+    charts = tmp_path / "charts"
+    charts.mkdir()
+    ledger_path = str(tmp_path / "mail_ledger.json")
+    for name in ("group_a.pdf", "group_b.pdf", "group_c.pdf"):
+        write_pdf(charts / name, 30_000)
+
+    def send():
+        return sendgrid.send_reports(
+            str(charts), mail_to="demo@example.nl", ledger_path=ledger_path, max_bytes=100_000, label="SV_test"
+        )
+
+    # 3 x ~40 KB na base64 past niet onder 100 KB: twee berichten
+    results = send()
+    assert [r.ok for r in results] == [True, True]
+    assert [m["Subject"] for m in inbox.messages] == [
+        "Demo – PDF charts – SV_test (1/2)",
+        "Demo – PDF charts – SV_test (2/2)",
+    ]
+    assert sum((attachments(m) for m in inbox.messages), []) == ["group_a.pdf", "group_b.pdf", "group_c.pdf"]
+    assert set(sendgrid.load_ledger(ledger_path)) == {"group_a.pdf", "group_b.pdf", "group_c.pdf"}
+
+    # Niets gewijzigd: de ledger slaat alles over
+    assert send() == []
+    assert len(inbox.messages) == 2
+
+    # Alleen de gewijzigde PDF gaat opnieuw
+    write_pdf(charts / "group_b.pdf", 1_000)
+    results = send()
+    assert [r.filenames for r in results] == [["group_b.pdf"]]
+    assert len(inbox.messages) == 3
+    assert inbox.messages[-1]["Subject"] == "Demo – PDF charts – SV_test"
+    assert attachments(inbox.messages[-1]) == ["group_b.pdf"]